@@ -0,0 +1,128 @@
+"""Concurrent load test against a running API: latency percentiles and throughput per concurrency level.
+
+Start the API (and its mongod) first, then run from backend/:
+
+    uvicorn main:app --port 8000
+    python -m benchmarks.load --url http://localhost:8000 --concurrency 1 8 32 --requests 200
+
+Without --dataset a synthetic CSV is uploaded first and its collection is used. Every level sends
+--requests requests to each --endpoint from that many client threads at once; since Mongo I/O runs on
+the API threadpool, throughput should grow with concurrency until API_THREADPOOL_SIZE or
+MONGO_MAX_POOL_SIZE is reached. Results are written as JSON next to the end-to-end benchmark's.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.run import RESULTS_DIR, _git_commit
+
+ENDPOINTS = {
+    "get-features": "/get-features/{dataset}",
+    "dataset-profile": "/dataset-profile/{dataset}",
+    "dataset-page": "/dataset/{dataset}?limit=100",
+    "datasets": "/datasets",
+    "models": "/models",
+}
+
+
+def _request(url: str, data: bytes = None, headers: dict = None, timeout: float = 60):
+    start = time.perf_counter()
+    request = urllib.request.Request(url, data=data, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body, status = e.read(), e.code
+    except (urllib.error.URLError, OSError) as e:
+        body, status = str(e).encode(), None
+    return status, body, time.perf_counter() - start
+
+
+def upload_dataset(base_url: str, rows: int) -> str:
+    from benchmarks.synthetic import make_dataset, to_csv_bytes
+
+    payload = to_csv_bytes(make_dataset(rows))
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"load.csv\"\r\n"
+            f"Content-Type: text/csv\r\n\r\n").encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    status, response, _ = _request(f"{base_url}/upload", body,
+                                   {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    if status != 200:
+        raise RuntimeError(f"upload failed with {status}: {response[:500]}")
+    return json.loads(response)["raw_collection"]
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_level(url: str, concurrency: int, requests: int) -> dict:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(lambda _: _request(url), range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency for status, _, latency in results if status == 200]
+    errors = len(results) - len(latencies)
+    summary = {"concurrency": concurrency, "requests": requests, "errors": errors,
+               "elapsed": round(elapsed, 4), "throughput": round(len(latencies) / elapsed, 2)}
+    if latencies:
+        summary.update({f"p{int(q * 100)}": round(_percentile(latencies, q), 4) for q in (0.5, 0.95, 0.99)})
+        summary["mean"] = round(statistics.mean(latencies), 4)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the running API")
+    parser.add_argument("--dataset", help="Collection to read (default: upload a synthetic one)")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows in the uploaded synthetic dataset")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), nargs="+", default=["get-features"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and level")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load_<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    base_url = args.url.rstrip("/")
+    dataset = args.dataset or upload_dataset(base_url, args.rows)
+
+    levels = []
+    for endpoint in args.endpoint:
+        url = base_url + ENDPOINTS[endpoint].format(dataset=dataset)
+        # One untimed request, so connection setup and cold caches are not charged to the first level
+        _request(url)
+        for concurrency in args.concurrency:
+            level = {"endpoint": endpoint, **run_level(url, concurrency, args.requests)}
+            levels.append(level)
+            print(f"{endpoint} concurrency={concurrency}: {level['throughput']} req/s, "
+                  f"p50 {level.get('p50')}s, p95 {level.get('p95')}s, p99 {level.get('p99')}s, "
+                  f"{level['errors']} errors")
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "url": base_url,
+        "dataset": dataset,
+        "cpu_count": os.cpu_count(),
+        "levels": levels,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, "load_" + datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results written to {output}")
+    return 1 if any(level["errors"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
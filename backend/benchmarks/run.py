@@ -0,0 +1,257 @@
+"""End-to-end benchmark: upload -> /selected-features -> /train-model -> /download-model.
+
+Run from backend/:
+
+    python -m benchmarks.run --rows 10000 50000 --model-type random_forest
+    python -m benchmarks.run --baseline benchmarks/results/<earlier>.json
+
+Uses an in-process mongomock unless --mongo-uri points at a real mongod. Results are written as
+JSON; with --baseline, stages slower than the baseline by more than --threshold are flagged and
+the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+STAGES = ("generate", "upload", "select_features", "train", "download")
+RSS_SAMPLE_SECONDS = 0.01
+
+
+def _peak_rss_mb() -> float:
+    # Process-wide high-water mark since start, so only meaningful for the run as a whole.
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _current_rss_mb() -> float:
+    # Resident set size right now; /proc only exists on Linux, elsewhere stages report no memory
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _setup_backend(mongo_uri: str):
+    # Both must be decided before any backend module creates its MongoClient or executor
+    os.environ.setdefault("TRAINING_EXECUTOR", "thread")
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+    else:
+        import mongomock
+        import mongomock.gridfs
+        import pymongo
+        mongomock.gridfs.enable_gridfs_integration()
+        pymongo.MongoClient = mongomock.MongoClient
+
+    from fastapi.testclient import TestClient
+    from main import app
+    return TestClient(app)
+
+
+class _Stage:
+    """Times a stage and samples RSS while it runs, so its peak is its own and not an earlier stage's."""
+
+    def __init__(self, timings: dict, name: str):
+        self.timings = timings
+        self.name = name
+
+    def _sample(self):
+        while not self.done.wait(RSS_SAMPLE_SECONDS):
+            self.peak_rss = max(self.peak_rss, _current_rss_mb())
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = _current_rss_mb()
+        self.done = threading.Event()
+        self.sampler = None
+        if self.start_rss is not None:
+            self.sampler = threading.Thread(target=self._sample, daemon=True)
+            self.sampler.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall_time = time.perf_counter() - self.start
+        self.done.set()
+        memory = {"peak_rss_mb": None, "rss_delta_mb": None}
+        if self.sampler:
+            self.sampler.join()
+            peak = max(self.peak_rss, _current_rss_mb())
+            memory = {"peak_rss_mb": round(peak, 1), "rss_delta_mb": round(peak - self.start_rss, 1)}
+        self.timings[self.name] = {"wall_time": round(wall_time, 4), **memory}
+
+
+def _check(response, stage: str):
+    if response.status_code >= 300:
+        raise RuntimeError(f"{stage} failed with {response.status_code}: {response.text[:500]}")
+    return response
+
+
+def run_scenario(client, scenario: dict) -> dict:
+    from benchmarks.synthetic import make_dataset, to_csv_bytes
+
+    timings = {}
+    start = time.perf_counter()
+    with _Stage(timings, "generate"):
+        df = make_dataset(scenario["rows"], scenario["numeric"], scenario["categorical"],
+                          scenario["cardinality"], scenario["task"], seed=scenario["seed"])
+        payload = to_csv_bytes(df)
+
+    with _Stage(timings, "upload"):
+        raw = _check(client.post("/upload", files={"file": ("bench.csv", payload, "text/csv")}), "upload")
+        raw = raw.json()["raw_collection"]
+
+    with _Stage(timings, "select_features"):
+        features = [column for column in df.columns if column != "target"]
+        processed = _check(client.post(f"/selected-features/{raw}", json={
+            "mode": "manual", "target_column": "target", "selected_features": features,
+            "fast_mode": scenario["fast_mode"],
+        }), "select_features").json()
+        if "processed_collection" not in processed:
+            raise RuntimeError(f"select_features failed: {processed}")
+
+    with _Stage(timings, "train"):
+        trained = _check(client.post("/train-model", json={
+            "collection_name": processed["processed_collection"],
+            "model_type": scenario["model_type"],
+            "auto_model_selection": scenario["auto"],
+            "wait": True,
+        }), "train").json()
+
+    with _Stage(timings, "download"):
+        artifact = _check(client.get(f"/download-model/{trained['file_id']}"), "download")
+
+    return {
+        "scenario": scenario,
+        "stages": timings,
+        "wall_time": round(time.perf_counter() - start, 4),
+        "peak_rss_mb": _peak_rss_mb(),
+        "upload_bytes": len(payload),
+        "artifact_bytes": len(artifact.content),
+        "model_type": trained.get("model_type"),
+        "metrics": trained.get("metrics"),
+    }
+
+
+def _max_of(values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _median_run(runs: list) -> dict:
+    result = dict(runs[-1])
+    result["stages"] = {
+        stage: {"wall_time": statistics.median(run["stages"][stage]["wall_time"] for run in runs),
+                "peak_rss_mb": _max_of(run["stages"][stage]["peak_rss_mb"] for run in runs),
+                "rss_delta_mb": _max_of(run["stages"][stage]["rss_delta_mb"] for run in runs)}
+        for stage in STAGES
+    }
+    result["wall_time"] = statistics.median(run["wall_time"] for run in runs)
+    result["repeats"] = len(runs)
+    return result
+
+
+def _scenario_key(scenario: dict) -> str:
+    return json.dumps({k: v for k, v in scenario.items() if k != "seed"}, sort_keys=True)
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float = 0.05) -> list:
+    """Stages whose median wall time grew by more than `threshold` over the matching baseline scenario."""
+    previous = {_scenario_key(run["scenario"]): run for run in baseline["runs"]}
+    regressions = []
+    for run in results["runs"]:
+        before = previous.get(_scenario_key(run["scenario"]))
+        if before is None:
+            continue
+        for stage in STAGES:
+            old, new = before["stages"][stage]["wall_time"], run["stages"][stage]["wall_time"]
+            # Ignore sub-noise stages; a 3 ms -> 5 ms change is not a regression
+            if new > old * (1 + threshold) and new - old > min_seconds:
+                regressions.append({"scenario": run["scenario"], "stage": stage, "baseline": old, "current": new,
+                                    "change": round(new / old - 1, 3) if old else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--numeric", type=int, default=8)
+    parser.add_argument("--categorical", type=int, default=2)
+    parser.add_argument("--cardinality", type=int, nargs="+", default=[10])
+    parser.add_argument("--task", choices=("classification", "regression"), nargs="+", default=["classification"])
+    parser.add_argument("--model-type", default="svm")
+    parser.add_argument("--auto", action="store_true", help="Use automatic model selection")
+    parser.add_argument("--fast-mode", action="store_true", help="Use fast feature selection")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; the median is reported")
+    parser.add_argument("--mongo-uri", help="Benchmark against this mongod instead of mongomock")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown per stage (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    client = _setup_backend(args.mongo_uri)
+
+    runs = []
+    for rows in args.rows:
+        for cardinality in args.cardinality:
+            for task in args.task:
+                scenario = {"rows": rows, "numeric": args.numeric, "categorical": args.categorical,
+                            "cardinality": cardinality, "task": task, "model_type": args.model_type,
+                            "auto": args.auto, "fast_mode": args.fast_mode, "seed": 42}
+                repeats = [run_scenario(client, scenario) for _ in range(args.repeat)]
+                run = _median_run(repeats)
+                runs.append(run)
+                stages = ", ".join(f"{stage} {run['stages'][stage]['wall_time']:.2f}s "
+                                   f"(+{run['stages'][stage]['rss_delta_mb']} MB)" for stage in STAGES)
+                print(f"rows={rows} cardinality={cardinality} task={task}: {stages} | "
+                      f"process peak RSS {run['peak_rss_mb']} MB")
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mongo": "mongod" if args.mongo_uri else "mongomock",
+        "runs": runs,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results["baseline"] = args.baseline
+        results["regressions"] = regressions
+        for regression in regressions:
+            print(f"REGRESSION {regression['stage']} {regression['baseline']:.3f}s -> {regression['current']:.3f}s "
+                  f"({regression['scenario']['rows']} rows, {regression['scenario']['task']})")
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results written to {output}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
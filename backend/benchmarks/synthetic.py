@@ -0,0 +1,41 @@
+import io
+import numpy as np
+import pandas as pd
+
+TASKS = ("classification", "regression")
+
+
+def make_dataset(rows: int, numeric: int = 8, categorical: int = 2, cardinality: int = 10,
+                 task: str = "classification", missing: float = 0.01, seed: int = 42) -> pd.DataFrame:
+    """Synthetic table with a learnable `target`: numeric and categorical features, a few missing values."""
+    if task not in TASKS:
+        raise ValueError(f"Unknown task '{task}'. Expected one of {TASKS}.")
+    rng = np.random.default_rng(seed)
+
+    data = {f"num_{i}": rng.normal(size=rows) for i in range(numeric)}
+    for i in range(categorical):
+        # Zipf-like skew, so high cardinalities have a long tail like real categorical data
+        weights = 1.0 / np.arange(1, cardinality + 1)
+        data[f"cat_{i}"] = rng.choice([f"c{i}_{j}" for j in range(cardinality)], size=rows, p=weights / weights.sum())
+    df = pd.DataFrame(data)
+
+    signal = np.zeros(rows)
+    for i in range(min(numeric, 4)):
+        signal += rng.normal() * df[f"num_{i}"].to_numpy()
+    for i in range(min(categorical, 2)):
+        effects = {value: rng.normal() for value in df[f"cat_{i}"].unique()}
+        signal += df[f"cat_{i}"].map(effects).to_numpy()
+    signal += rng.normal(scale=0.5, size=rows)
+
+    if missing:
+        for column in df.columns[:numeric]:
+            df.loc[rng.random(rows) < missing, column] = np.nan
+
+    df["target"] = (signal > np.median(signal)).astype(int) if task == "classification" else signal
+    return df
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue().encode()
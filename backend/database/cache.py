@@ -0,0 +1,76 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Budget per process: the API and each training worker (TRAINING_EXECUTOR=process) hold their own
+# cache, so worst-case memory is (TRAINING_WORKERS + 1) * DATASET_CACHE_BYTES
+DATASET_CACHE_BYTES = int(os.getenv("DATASET_CACHE_BYTES", str(1024 ** 3)))
+
+
+class DataFrameCache:
+    """Per-process LRU of DataFrames keyed by (collection_name, version, columns), bounded in bytes.
+
+    `columns` is None for the whole dataset, else the tuple of columns the frame holds.
+    """
+
+    def __init__(self, max_bytes: int = DATASET_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df: pd.DataFrame):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            newest = max((cached[1] for cached in self.entries if cached[0] == key[0]), default=None)
+            if newest is not None and newest > key[1]:
+                # Read before a concurrent write landed; nobody asks for this version any more
+                return
+            # Any older version of the same collection is stale now
+            self._discard(key[0], before=key[1])
+            replaced = self.entries.pop(key, None)
+            if replaced is not None:
+                self.current_bytes -= replaced[1]
+            self.entries[key] = (df, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def invalidate(self, collection_name: str):
+        with self.lock:
+            self._discard(collection_name)
+
+    def _discard(self, collection_name: str, before: int = None):
+        for key in [key for key in self.entries
+                    if key[0] == collection_name and (before is None or key[1] < before)]:
+            _, size = self.entries.pop(key)
+            self.current_bytes -= size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+dataset_cache = DataFrameCache()
@@ -0,0 +1,198 @@
+import io
+import os
+import tempfile
+import pandas as pd
+from gridfs import GridFS
+from pymongo import ReturnDocument
+
+from database.mongo import db
+from database.cache import dataset_cache
+from utils.instrumentation import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar storage is optional; fall back to row documents
+    pa = None
+    pq = None
+
+COLUMNAR_STORAGE = pa is not None and os.getenv("COLUMNAR_STORAGE", "true").lower() not in ("0", "false", "no")
+# Row groups are the unit a streaming reader decodes, so they bound its memory
+COLUMNAR_ROW_GROUP_ROWS = int(os.getenv("COLUMNAR_ROW_GROUP_ROWS", "65536"))
+
+columnar_fs = GridFS(db, collection="columnar")
+dataset_versions = db["dataset_versions"]
+
+
+def dataset_version(collection_name: str) -> int:
+    doc = dataset_versions.find_one({"_id": collection_name}, {"version": 1})
+    return doc["version"] if doc else 0
+
+
+def mark_dataset_written(collection_name: str, df: pd.DataFrame = None) -> int:
+    # Bump the version so every worker's cached copy goes stale, then drop ours
+    doc = dataset_versions.find_one_and_update(
+        {"_id": collection_name},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    dataset_cache.invalidate(collection_name)
+    if df is not None:
+        dataset_cache.put((collection_name, doc["version"], None), df)
+    return doc["version"]
+
+
+def has_columnar(collection_name: str) -> bool:
+    return COLUMNAR_STORAGE and columnar_fs.exists({"filename": collection_name})
+
+
+def columnar_parts(collection_name: str) -> list:
+    # Appends add a Parquet part instead of rewriting the file; parts are read in write order
+    return list(columnar_fs.find({"filename": collection_name}).sort("_id", 1))
+
+
+def delete_columnar(collection_name: str):
+    for grid_out in columnar_fs.find({"filename": collection_name}):
+        columnar_fs.delete(grid_out._id)
+
+
+class ColumnarWriter:
+    """Accumulates DataFrame chunks into one Parquet file and stores it in GridFS on close.
+
+    With `append`, the file is added as a new part next to the existing ones instead of replacing them.
+    """
+
+    def __init__(self, collection_name: str, append: bool = False):
+        self.collection_name = collection_name
+        self.append = append
+        self.buffer = tempfile.TemporaryFile()
+        self.writer = None
+        self.row_count = 0
+        self.failed = False
+
+    def write(self, df: pd.DataFrame):
+        if self.failed:
+            return
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self.writer is None:
+                schema = self._existing_schema() if self.append else None
+                if schema is not None and not table.schema.equals(schema):
+                    # One schema across parts, so readers can stream them back to back
+                    table = table.select(schema.names).cast(schema)
+                self.writer = pq.ParquetWriter(self.buffer, table.schema)
+            elif not table.schema.equals(self.writer.schema):
+                # Later chunks may infer different dtypes (e.g. ints with NaN as floats)
+                table = table.cast(self.writer.schema)
+            self.writer.write_table(table, row_group_size=COLUMNAR_ROW_GROUP_ROWS)
+            self.row_count += len(df)
+        except (pa.ArrowException, ValueError) as e:
+            self.failed = True
+            if self.append:
+                # Dropping the part would leave the existing parts short of rows readers expect
+                raise ValueError(f"Appended rows do not fit the stored schema of '{self.collection_name}': {e}")
+            print(f"Columnar copy of '{self.collection_name}' disabled: {e}")
+
+    def _existing_schema(self):
+        parts = columnar_parts(self.collection_name)
+        return pq.read_schema(pa.PythonFile(parts[0], mode="r")) if parts else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.failed or self.writer is None:
+            self.buffer.close()
+            return None
+
+        self.buffer.seek(0)
+        if not self.append:
+            delete_columnar(self.collection_name)
+        file_id = columnar_fs.put(
+            self.buffer,
+            filename=self.collection_name,
+            metadata={"format": "parquet", "row_count": self.row_count, "append": self.append},
+        )
+        self.buffer.close()
+        return file_id
+
+    def abort(self):
+        self.failed = True
+        self.close()
+
+
+def save_columnar(collection_name: str, df: pd.DataFrame):
+    if not COLUMNAR_STORAGE:
+        return None
+    writer = ColumnarWriter(collection_name)
+    writer.write(df)
+    return writer.close()
+
+
+def read_dataset(collection_name: str, columns: list = None) -> pd.DataFrame:
+    # Prefer the Parquet copy: typed columns without decoding BSON row by row
+    parts = columnar_parts(collection_name) if COLUMNAR_STORAGE else []
+    if parts:
+        frames = [pq.read_table(io.BytesIO(grid_out.read()), columns=columns).to_pandas() for grid_out in parts]
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    projection = {"_id": 0}
+    if columns:
+        projection.update({column: 1 for column in columns})
+    return pd.DataFrame(list(db[collection_name].find({}, projection)))
+
+
+def iter_dataset_batches(collection_name: str, batch_size: int, columns: list = None):
+    """Yield the dataset as DataFrames of at most `batch_size` rows without materialising all of it."""
+    parts = columnar_parts(collection_name) if COLUMNAR_STORAGE else []
+    if parts:
+        # GridOut is seekable, so Parquet reads the footer and then one row group at a time
+        for grid_out in parts:
+            parquet = pq.ParquetFile(pa.PythonFile(grid_out, mode="r"))
+            for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+                yield batch.to_pandas()
+        return
+
+    projection = {"_id": 0}
+    if columns:
+        projection.update({column: 1 for column in columns})
+    batch = []
+    for doc in db[collection_name].find({}, projection).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def _copy_on_write() -> bool:
+    # Always on from pandas 3; an opt-in mode before that
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+
+def load_dataset(collection_name: str, columns: list = None) -> pd.DataFrame:
+    """Load a dataset, or just `columns` of it, through the shared cache.
+
+    Callers get their own copy, so changing it never reaches the cached frame.
+    """
+    # The version is taken before reading: if a write lands mid-read, the frame is cached under the
+    # version it replaced, which no later call asks for
+    version = dataset_version(collection_name)
+    df = dataset_cache.get((collection_name, version, None))
+    if df is not None:
+        df = df[columns] if columns else df
+    else:
+        key = (collection_name, version, tuple(columns) if columns else None)
+        df = dataset_cache.get(key) if columns else None
+        if df is None:
+            with span("dataset.read"):
+                # Only the requested columns are decoded
+                df = read_dataset(collection_name, columns)
+            if not df.empty:
+                dataset_cache.put(key, df)
+
+    # Under copy-on-write a shallow copy already keeps the caller's writes off the cached data
+    return df.copy(deep=not _copy_on_write())
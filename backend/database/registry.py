@@ -0,0 +1,165 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from database.mongo import db
+
+models_registry = db["models"]
+datasets_registry = db["datasets"]
+# Memoized training results, keyed by (dataset hash, config hash, code version)
+training_runs = db["training_runs"]
+
+# Metrics that can be ranked, and whether bigger is better
+RANKED_METRICS = {
+    "accuracy": DESCENDING,
+    "r2": DESCENDING,
+    "f1_score": DESCENDING,
+    "silhouette_score": DESCENDING,
+    "rmse": ASCENDING,
+    "mae": ASCENDING,
+}
+
+
+def ensure_indexes():
+    models_registry.create_index([("dataset", ASCENDING), ("model_type", ASCENDING), ("created_at", DESCENDING)])
+    models_registry.create_index([("created_at", DESCENDING)])
+    for metric, direction in RANKED_METRICS.items():
+        models_registry.create_index([("dataset", ASCENDING), (f"metrics.{metric}", direction)])
+
+    datasets_registry.create_index([("kind", ASCENDING), ("created_at", DESCENDING)])
+    datasets_registry.create_index([("created_at", DESCENDING)])
+    datasets_registry.create_index([("content_hash", ASCENDING)])
+    datasets_registry.create_index([("lineage.memo_key", ASCENDING)])
+    # One in-flight upload per content hash: the claim that lets concurrent identical uploads dedupe
+    datasets_registry.create_index([("content_hash", ASCENDING), ("status", ASCENDING)], unique=True,
+                                   partialFilterExpression={"status": "ingesting"})
+    training_runs.create_index([("file_id", ASCENDING)])
+
+
+def import_legacy_models():
+    """Register models saved before the registry existed, once per database.
+
+    Those were recorded one `trained_model_<timestamp>` collection per model, with random forest
+    accuracy as a 0-100 percentage; it is rescaled to the 0-1 range every other model reports.
+    """
+    migrations = db["migrations"]
+    if migrations.find_one({"_id": "legacy_trained_models"}):
+        return 0
+    imported = 0
+    for name in db.list_collection_names(filter={"name": {"$regex": "^trained_model_"}}):
+        for doc in db[name].find():
+            if "file_id" not in doc or models_registry.find_one({"_id": doc["file_id"]}, {"_id": 1}):
+                continue
+            metrics = {key: value for key, value in doc.items()
+                       if key not in ("_id", "model_name", "file_id", "timestamp")}
+            if doc.get("model_name") == "random_forest" and metrics.get("accuracy") is not None:
+                metrics["accuracy"] = metrics["accuracy"] / 100
+            try:
+                created_at = datetime.strptime(doc["timestamp"], "%d%m%Y_%H%M%S")
+            except (KeyError, TypeError, ValueError):
+                created_at = doc["file_id"].generation_time.replace(tzinfo=None)
+            models_registry.insert_one({
+                "_id": doc["file_id"],
+                "model_type": doc.get("model_name"),
+                "dataset": None,
+                "filename": f"{doc.get('model_name')}_{doc.get('timestamp')}",
+                "created_at": created_at,
+                "metrics": metrics,
+                "timestamp": doc.get("timestamp"),
+                "legacy_collection": name,
+            })
+            imported += 1
+    migrations.insert_one({"_id": "legacy_trained_models", "imported": imported, "applied_at": datetime.now()})
+    return imported
+
+
+def register_model(file_id, model_type: str, filename: str, metrics: dict, dataset: str = None, **extra):
+    models_registry.insert_one({
+        "_id": file_id,
+        "model_type": model_type,
+        "dataset": dataset,
+        "filename": filename,
+        "created_at": datetime.now(),
+        "metrics": metrics,
+        **extra,
+    })
+
+
+def annotate_model(file_id, **fields):
+    models_registry.update_one({"_id": ObjectId(file_id) if isinstance(file_id, str) else file_id}, {"$set": fields})
+
+
+def register_dataset(name: str, kind: str, **extra):
+    datasets_registry.update_one(
+        {"_id": name},
+        {"$set": {"kind": kind, "updated_at": datetime.now(), **extra},
+         "$setOnInsert": {"created_at": datetime.now()}},
+        upsert=True,
+    )
+
+
+def claim_dataset(name: str, kind: str, content_hash: str, **extra) -> bool:
+    """Register `name` as still ingesting; False if the same content is already being ingested."""
+    try:
+        datasets_registry.insert_one({"_id": name, "kind": kind, "status": "ingesting", "content_hash": content_hash,
+                                      "created_at": datetime.now(), "updated_at": datetime.now(), **extra})
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def touch_claim(name: str):
+    # Heartbeat of a running ingest; garbage collection only reclaims claims that stopped beating
+    datasets_registry.update_one({"_id": name, "status": "ingesting"}, {"$set": {"updated_at": datetime.now()}})
+
+
+def dataset_exists(name: str) -> bool:
+    if datasets_registry.find_one({"_id": name}, {"_id": 1}):
+        return True
+    # Datasets uploaded before the registry existed only have their collection
+    return bool(db.list_collection_names(filter={"name": name}))
+
+
+def _page(collection, query: dict, sort: list, page: int, page_size: int):
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), 200)
+    items = list(collection.find(query).sort(sort).skip((page - 1) * page_size).limit(page_size))
+    return {
+        "items": items,
+        "page": page,
+        "page_size": page_size,
+        "total": collection.count_documents(query),
+    }
+
+
+def list_models(dataset: str = None, model_type: str = None, sort_by: str = "created_at",
+                page: int = 1, page_size: int = 20):
+    query = {}
+    if dataset:
+        query["dataset"] = dataset
+    if model_type:
+        query["model_type"] = model_type
+
+    if sort_by in RANKED_METRICS:
+        sort = [(f"metrics.{sort_by}", RANKED_METRICS[sort_by])]
+        query[f"metrics.{sort_by}"] = {"$ne": None}
+    elif sort_by == "created_at":
+        sort = [("created_at", DESCENDING)]
+    else:
+        raise ValueError(f"Unsupported sort '{sort_by}'. Use created_at or one of {list(RANKED_METRICS)}.")
+    return _page(models_registry, query, sort, page, page_size)
+
+
+def best_model(dataset: str, metric: str = "accuracy", model_type: str = None):
+    if metric not in RANKED_METRICS:
+        raise ValueError(f"Unsupported metric '{metric}'. Use one of {list(RANKED_METRICS)}.")
+    query = {"dataset": dataset, f"metrics.{metric}": {"$ne": None}}
+    if model_type:
+        query["model_type"] = model_type
+    return models_registry.find_one(query, sort=[(f"metrics.{metric}", RANKED_METRICS[metric])])
+
+
+def list_datasets(kind: str = None, page: int = 1, page_size: int = 20):
+    query = {"kind": kind} if kind else {}
+    return _page(datasets_registry, query, [("created_at", DESCENDING)], page, page_size)
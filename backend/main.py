@@ -1,4 +1,8 @@
-from fastapi import FastAPI
+import asyncio
+import os
+import time
+import anyio
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from routes import (
@@ -8,12 +12,86 @@ from routes import (
     select_features,
     train_models,
     download_model,
+    predict,
+    registry,
+    metrics,
+    maintenance,
     # get_processed_data
 )
+from database.registry import ensure_indexes, import_legacy_models
+from utils.jobs import recover_jobs, shutdown_executor
+from utils.instrumentation import registry as metrics_registry, collect_spans, server_timing
+from utils.cleanup import collect_garbage, GC_INTERVAL_SECONDS
+
+# Sync routes and run_in_threadpool share this many threads; match MONGO_MAX_POOL_SIZE or below
+API_THREADPOOL_SIZE = int(os.getenv("API_THREADPOOL_SIZE", "64"))
 
 app = FastAPI()
 
 
+@app.on_event("startup")
+def size_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = API_THREADPOOL_SIZE
+
+
+@app.on_event("startup")
+def create_indexes():
+    ensure_indexes()
+    imported = import_legacy_models()
+    if imported:
+        print(f"Registered {imported} model(s) saved before the model registry")
+
+
+@app.on_event("startup")
+def resume_training_jobs():
+    recovered = recover_jobs()
+    if recovered:
+        print(f"Requeued {len(recovered)} interrupted training job(s)")
+
+
+async def _collect_garbage_periodically():
+    while True:
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
+        try:
+            report = await asyncio.to_thread(collect_garbage)
+            removed = sum(len(value) for value in report.values() if isinstance(value, list))
+            print(f"Garbage collection removed {removed} item(s) in {report['elapsed']}s")
+        except Exception as e:
+            print(f"Garbage collection failed: {e}")
+
+
+@app.on_event("startup")
+async def schedule_garbage_collection():
+    if GC_INTERVAL_SECONDS > 0:
+        app.state.gc_task = asyncio.create_task(_collect_garbage_periodically())
+
+
+@app.on_event("shutdown")
+def stop_training_jobs():
+    shutdown_executor()
+
+
+@app.on_event("shutdown")
+def stop_garbage_collection():
+    task = getattr(app.state, "gc_task", None)
+    if task is not None:
+        task.cancel()
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    # Send "X-Timing: 1" to get the stage breakdown back as a Server-Timing header
+    start = time.perf_counter()
+    with collect_spans() as spans:
+        response = await call_next(request)
+    route = request.scope.get("route")
+    metrics_registry.observe_request(request.method, route.path if route else "unmatched",
+                                     response.status_code, time.perf_counter() - start)
+    if request.headers.get("x-timing") and spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    return response
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -30,3 +108,7 @@ app.include_router(select_features.router)
 # app.include_router(get_processed_data.router)
 app.include_router(train_models.router)
 app.include_router(download_model.router)
+app.include_router(predict.router)
+app.include_router(registry.router)
+app.include_router(metrics.router)
+app.include_router(maintenance.router)
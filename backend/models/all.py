@@ -1,29 +1,182 @@
+import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
 from models.linear_regression import train_linear_regression
 from models.random_forest import train_random_forest
 from models.svm import train_svm
 from models.k_means import train_kmeans
+from models.cross_validation import prepare_folds
+from models.tuning import tune, record_tuning, TUNABLE
 from preprocessing.preprocessor import detect_target_column
-from database.mongo import db
-import pandas as pd
+from database.datasets import load_dataset
+from utils.profile import get_profile
+from utils.jobs import TRAINING_EXECUTOR
 
-def select_best_model(collection_name: str, test_size: float = 0.2, cross_validation: bool = False):
+TIME_BUDGET = float(os.getenv("MODEL_SELECTION_TIME_BUDGET", "600"))
+CANDIDATE_TIMEOUT = float(os.getenv("MODEL_SELECTION_CANDIDATE_TIMEOUT", "0")) or None
+
+
+CANDIDATE_TYPES = {
+    "Linear Regression": "linear_regression",
+    "Random Forest": "random_forest",
+    "SVM": "svm",
+    "KMeans": "k_means",
+}
+
+
+def _run_candidate(name, X, y, test_size, cross_validation, collection_name, folds=None, tuning_deadline=None,
+                   n_jobs=-1, start=None, deadline=None):
+    if name not in CANDIDATE_TYPES:
+        raise ValueError(f"Unknown candidate model '{name}'")
+    tuning = None
+    if tuning_deadline and CANDIDATE_TYPES[name] in TUNABLE:
+        tuning = tune(CANDIDATE_TYPES[name], X, y, n_jobs=n_jobs, deadline=tuning_deadline)
+    params = tuning["params"] if tuning else None
+
+    if name == "Linear Regression":
+        result = train_linear_regression(X, y, cross_validation, dataset=collection_name, folds=folds, params=params,
+                                         n_jobs=n_jobs)
+    elif name == "Random Forest":
+        result = train_random_forest(X, y, dataset=collection_name, params=params, n_jobs=n_jobs)
+    elif name == "SVM":
+        result = train_svm(X, y, test_size, cross_validation, dataset=collection_name, folds=folds, params=params,
+                           n_jobs=n_jobs)
+    else:
+        # The k search only gets what is left of the selection budget
+        remaining = max(0.0, deadline - time.perf_counter()) if deadline else None
+        result = train_kmeans(X, dataset=collection_name, time_budget=remaining)
+
+    if tuning:
+        result["tuning"] = record_tuning(result["file_id"], tuning)
+    # Taken here, when this candidate is done, not when the parent gets round to collecting it
+    if start is not None:
+        result["wall_time"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def _candidate_process(conn, name, args):
+    try:
+        conn.send(("ok", _run_candidate(name, *args)))
+    except Exception as e:
+        conn.send(("failed", str(e)))
+    finally:
+        conn.close()
+
+
+def _run_in_processes(tasks: dict, deadline: float) -> dict:
+    """One non-daemonic spawned process per candidate, so joblib inside it can still start workers.
+
+    Candidates still running at the deadline are terminated.
+    """
+    context = multiprocessing.get_context("spawn")
+    running = {}
+    for name, args in tasks.items():
+        parent, child = context.Pipe(duplex=False)
+        process = context.Process(target=_candidate_process, args=(child, name, args), daemon=False)
+        process.start()
+        child.close()
+        running[parent] = (name, process)
+
+    outcomes = {}
+    try:
+        while running:
+            ready = wait(list(running), timeout=max(0.0, deadline - time.perf_counter()))
+            if not ready:
+                break
+            for conn in ready:
+                name, process = running.pop(conn)
+                try:
+                    outcomes[name] = conn.recv()
+                except EOFError:
+                    outcomes[name] = ("failed", f"worker exited with code {process.exitcode}")
+                process.join()
+    finally:
+        for conn, (name, process) in running.items():
+            process.terminate()
+            process.join()
+            outcomes[name] = ("timeout", None)
+    return outcomes
+
+
+def _run_in_threads(tasks: dict, deadline: float) -> dict:
+    """Thread mode (in-process Mongo stand-ins): threads cannot be stopped, so candidates past the
+    deadline keep running in the background and their results are discarded."""
+    executor = ThreadPoolExecutor(max_workers=len(tasks))
+    futures = {executor.submit(_run_candidate, name, *args): name for name, args in tasks.items()}
+    outcomes = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait_futures(pending, timeout=max(0.0, deadline - time.perf_counter()),
+                                     return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                outcomes[futures[future]] = ("ok", future.result())
+            except Exception as e:
+                outcomes[futures[future]] = ("failed", str(e))
+    for future in pending:
+        outcomes[futures[future]] = ("timeout", None)
+    executor.shutdown(wait=False, cancel_futures=True)
+    return outcomes
+
+
+def select_best_model(collection_name: str, test_size: float = 0.2, cross_validation: bool = False,
+                      time_budget: float = TIME_BUDGET, candidate_timeout: float = CANDIDATE_TIMEOUT,
+                      target_column: str = None, tune_models: bool = False):
     # Load data once
-    df = pd.DataFrame(list(db[collection_name].find({}, {"_id": 0})))
-    target_column = detect_target_column(df)
+    df = load_dataset(collection_name)
+    target_column = target_column or detect_target_column(df, get_profile(collection_name))
 
     X = df.drop(columns=[target_column])
     y = df[target_column]
 
-    results = {
-        "Linear Regression": train_linear_regression(X, y, test_size, cross_validation)[1],
-        "Random Forest": train_random_forest(X, y, test_size, cross_validation)[1],
-        "SVM": train_svm(X, y, test_size, cross_validation)[1],
-    }
+    candidates = ["Linear Regression", "Random Forest", "SVM"]
 
     # KMeans is only relevant if target has many classes (like clustering)
     if y.nunique() > 10:
-        model, metrics = train_kmeans(X)
-        results["KMeans"] = metrics
+        candidates.append("KMeans")
+
+    # One fold plan for every candidate: same splits, fold matrices cut once and memory-mapped by each
+    folds = prepare_folds(X, y, collection_name) if cross_validation else None
+
+    # Every candidate starts at once, so each deadline is absolute from here
+    start = time.perf_counter()
+    deadline = start + time_budget
+    if candidate_timeout:
+        deadline = min(deadline, start + candidate_timeout)
+
+    # Candidates tune concurrently; searching stops halfway to the deadline to leave the rest for the final fits
+    tuning_deadline = start + (deadline - start) / 2 if tune_models else None
+
+    # Candidates run side by side, so each gets an equal share of the cores for its own joblib work
+    n_jobs = max(1, (os.cpu_count() or 1) // len(candidates))
+    args = (X, y, test_size, cross_validation, collection_name, folds, tuning_deadline, n_jobs, start, deadline)
+    run = _run_in_threads if TRAINING_EXECUTOR == "thread" else _run_in_processes
+    outcomes = run({name: args for name in candidates}, deadline)
+
+    results = {}
+    timings = {}
+    for name in candidates:
+        status, value = outcomes[name]
+        if status == "timeout":
+            timings[name] = {"status": "timeout", "wall_time": round(time.perf_counter() - start, 4)}
+        elif status == "failed":
+            timings[name] = {"status": "failed", "error": value}
+        else:
+            results[name] = value
+            timings[name] = {
+                "status": "ok",
+                "fit_time": value.get("fit_time"),
+                "score_time": value.get("score_time"),
+                "tuning": value.get("tuning"),
+                "wall_time": value.get("wall_time"),
+            }
+
+    if not results:
+        raise ValueError(f"No candidate model finished within the time budget: {timings}")
 
     # Use accuracy if present; fallback to negative RMSE for regression
     def get_metric(metrics_dict):
@@ -35,5 +188,6 @@ def select_best_model(collection_name: str, test_size: float = 0.2, cross_valida
         "best_model": best_model_name,
         "file_id": best_metrics["file_id"],
         "filename": best_metrics["filename"],
-        "metrics": best_metrics
+        "metrics": best_metrics,
+        "candidates": timings
     }
@@ -0,0 +1,130 @@
+import os
+import time
+import tempfile
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.model_selection import KFold, StratifiedKFold
+
+from database.datasets import dataset_version
+from utils.instrumentation import span
+
+CV_FOLDS = int(os.getenv("CV_FOLDS", "5"))
+CV_N_JOBS = int(os.getenv("CV_N_JOBS", "-1"))
+CV_CACHE_DIR = os.getenv("CV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mlstudio-folds"))
+# Least recently used fold files are deleted once the directory grows past this; 0 disables the cap
+CV_CACHE_MAX_MB = float(os.getenv("CV_CACHE_MAX_MB", "2048"))
+# Files used more recently than this may still be memory-mapped by a running job and are never evicted
+CV_CACHE_MIN_AGE_SECONDS = int(os.getenv("CV_CACHE_MIN_AGE_SECONDS", "3600"))
+MAX_STRATA = 50  # Targets with more distinct values than this are split as regression
+
+
+def is_classification_target(y) -> bool:
+    y = pd.Series(np.asarray(y))
+    if y.dtype.kind == "f" and not np.all(np.mod(y.dropna(), 1) == 0):
+        return False
+    return y.nunique() <= MAX_STRATA
+
+
+class FoldPlan:
+    """Train/test indices for every fold plus the fold matrices, dumped once and memory-mapped by each worker.
+
+    Small enough to pickle, so one plan can be handed to every candidate process.
+    """
+
+    def __init__(self, folds: list, stratified: bool, path: str):
+        self.folds = folds
+        self.stratified = stratified
+        self.path = path
+
+    def __len__(self):
+        return len(self.folds)
+
+    def matrices(self, fold: int):
+        X_train, X_test, y_train, y_test = joblib.load(self.path, mmap_mode="r")[fold]
+        return X_train, X_test, y_train, y_test
+
+
+def _content_hash(*arrays) -> str:
+    # Hashes values rather than raw buffers, which for object arrays are just pointers
+    digest = hashlib.sha256()
+    for array in arrays:
+        frame = pd.DataFrame(array.reshape(len(array), -1))
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _evict_folds(keep: str):
+    if CV_CACHE_MAX_MB <= 0:
+        return
+    entries = [entry for entry in os.scandir(CV_CACHE_DIR) if entry.is_file() and entry.path != keep]
+    total = sum(entry.stat().st_size for entry in entries) + os.path.getsize(keep)
+    in_use = time.time() - CV_CACHE_MIN_AGE_SECONDS
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total <= CV_CACHE_MAX_MB * 1024 * 1024 or entry.stat().st_mtime > in_use:
+            break
+        try:
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def prepare_folds(X, y, dataset: str = None, n_splits: int = CV_FOLDS) -> FoldPlan:
+    X, y = np.asarray(X), np.asarray(y)
+    counts = pd.Series(y).value_counts()
+    stratified = is_classification_target(y) and counts.min() >= n_splits
+    splitter = StratifiedKFold if stratified else KFold
+    folds = list(splitter(n_splits=n_splits, shuffle=True, random_state=42).split(X, y))
+
+    # The same dataset version always yields the same folds, so their matrices are cut once per host
+    if dataset:
+        key = f"{dataset}:{dataset_version(dataset)}:{n_splits}:{X.shape}:{_content_hash(y)}"
+    else:
+        key = f"{n_splits}:{X.shape}:{_content_hash(X, y)}"
+    os.makedirs(CV_CACHE_DIR, exist_ok=True)
+    path = os.path.join(CV_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest()[:24] + ".joblib")
+    if os.path.exists(path):
+        # Marks the file as recently used for eviction
+        os.utime(path)
+    else:
+        fd, tmp_path = tempfile.mkstemp(dir=CV_CACHE_DIR)
+        os.close(fd)
+        joblib.dump([(X[train], X[test], y[train], y[test]) for train, test in folds], tmp_path)
+        os.replace(tmp_path, path)
+        _evict_folds(keep=path)
+    return FoldPlan(folds, stratified, path)
+
+
+def _run_fold(estimator, plan: FoldPlan, fold: int, scorer):
+    X_train, X_test, y_train, y_test = plan.matrices(fold)
+    model = clone(estimator)
+    fit_start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - fit_start
+
+    score_start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    metrics = scorer(np.asarray(y_test), y_pred)
+    return y_pred, {
+        "fold": fold,
+        **metrics,
+        "fit_time": round(fit_time, 4),
+        "score_time": round(time.perf_counter() - score_start, 4),
+    }
+
+
+def cross_validate(estimator, plan: FoldPlan, scorer, n_jobs: int = CV_N_JOBS):
+    """Fit and score every fold in parallel; returns (out-of-fold predictions, per-fold metrics)."""
+    with span("cross_validate"):
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_run_fold)(estimator, plan, fold, scorer) for fold in range(len(plan))
+        )
+    # Put the fold predictions back in row order; concatenating first keeps a dtype wide enough for
+    # every fold (e.g. the longest string label), which fold 0's dtype alone may not be
+    y_pred = np.concatenate([np.asarray(fold_pred) for fold_pred, _ in results])
+    y_pred[np.concatenate([test for _, test in plan.folds])] = y_pred.copy()
+    return y_pred, [fold_metrics for _, fold_metrics in results]
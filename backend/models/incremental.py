@@ -0,0 +1,294 @@
+import copy
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.linear_model import SGDClassifier, SGDRegressor
+from sklearn.metrics import silhouette_score
+
+from database.datasets import iter_dataset_batches
+from database.registry import annotate_model
+from models.k_means import SILHOUETTE_SAMPLE_ROWS
+from utils.artifacts import load_artifact
+from utils.profile import get_profile
+from utils.save_model import save_model
+from utils.instrumentation import span
+
+INCREMENTAL_BATCH_ROWS = int(os.getenv("INCREMENTAL_BATCH_ROWS", "10000"))
+INCREMENTAL_EPOCHS = int(os.getenv("INCREMENTAL_EPOCHS", "1"))
+HOLDOUT_FRACTION = float(os.getenv("INCREMENTAL_HOLDOUT_FRACTION", "0.2"))
+MAX_CLASSES = 1000
+# A streamed fit cannot search for k, so k_means uses this unless the request names a cluster count
+INCREMENTAL_KMEANS_CLUSTERS = int(os.getenv("INCREMENTAL_KMEANS_CLUSTERS", "3"))
+
+# partial_fit-capable stand-ins for the in-memory trainers
+ESTIMATORS = {
+    "linear_regression": lambda: SGDRegressor(random_state=42),
+    "svm": lambda: SGDClassifier(loss="hinge", random_state=42),
+    "k_means": lambda: MiniBatchKMeans(n_clusters=INCREMENTAL_KMEANS_CLUSTERS, random_state=42, n_init=3),
+}
+
+
+def _holdout_mask(n: int, batch_index: int, fraction: float, seed: int = 42) -> np.ndarray:
+    # Seeded by batch position, so every epoch and the scoring pass pick the same rows
+    return np.random.default_rng([seed, batch_index]).random(n) < fraction
+
+
+class _RegressionScore:
+    def __init__(self):
+        self.n = 0
+        self.sse = 0.0
+        self.sae = 0.0
+        self.sum_y = 0.0
+        self.sum_y2 = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=float)
+        error = y_true - y_pred
+        self.n += len(y_true)
+        self.sse += float(np.sum(error ** 2))
+        self.sae += float(np.sum(np.abs(error)))
+        self.sum_y += float(y_true.sum())
+        self.sum_y2 += float(np.sum(y_true ** 2))
+
+    def result(self) -> dict:
+        if not self.n:
+            return {"rmse": None, "mae": None, "r2": None}
+        total = self.sum_y2 - self.sum_y ** 2 / self.n
+        return {
+            "rmse": float(np.sqrt(self.sse / self.n)),
+            "mae": self.sae / self.n,
+            "r2": 1 - self.sse / total if total > 0 else None,
+        }
+
+
+class _ClassificationScore:
+    def __init__(self, classes):
+        self.classes = np.asarray(classes)
+        self.confusion = np.zeros((len(classes), len(classes)), dtype=np.int64)
+
+    def update(self, y_true, y_pred):
+        index = {label: i for i, label in enumerate(self.classes.tolist())}
+        rows = np.array([index[label] for label in np.asarray(y_true).tolist()], dtype=np.int64)
+        cols = np.array([index[label] for label in np.asarray(y_pred).tolist()], dtype=np.int64)
+        np.add.at(self.confusion, (rows, cols), 1)
+
+    def result(self) -> dict:
+        total = self.confusion.sum()
+        if not total:
+            return {"accuracy": None}
+        tp = np.diag(self.confusion).astype(float)
+        predicted, actual = self.confusion.sum(axis=0), self.confusion.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, actual, out=np.zeros_like(tp), where=actual > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(tp), where=(precision + recall) > 0)
+        return {
+            "accuracy": float(tp.sum() / total),
+            "precision": float(precision.mean()),
+            "recall": float(recall.mean()),
+            "f1_score": float(f1.mean()),
+            "confusion_matrix": self.confusion.tolist(),
+        }
+
+
+def _target_classes(collection_name: str, target_column: str, batch_size: int, limit: int = MAX_CLASSES):
+    # One streamed pass over the target column only; None once it has more than `limit` values
+    classes = set()
+    for batch in iter_dataset_batches(collection_name, batch_size, columns=[target_column]):
+        classes.update(batch[target_column].dropna().unique().tolist())
+        if len(classes) > limit:
+            return None
+    return np.array(sorted(classes))
+
+
+def train_incremental(collection_name: str, model_type: str, target_column: str, transform=None,
+                      input_columns: list = None, batch_size: int = INCREMENTAL_BATCH_ROWS,
+                      epochs: int = INCREMENTAL_EPOCHS, holdout_fraction: float = HOLDOUT_FRACTION,
+                      n_clusters: int = None, report=None):
+    """Fit a partial_fit estimator on fixed-size batches streamed from the dataset; memory is bounded by batch_size.
+
+    `transform` is an already fitted preprocessing pipeline applied to each batch (raw datasets);
+    processed datasets are streamed as they are.
+    """
+    if model_type not in ESTIMATORS:
+        raise ValueError(f"Incremental training supports {list(ESTIMATORS)}, not '{model_type}'.")
+    model = ESTIMATORS[model_type]()
+    if model_type == "k_means":
+        model.set_params(batch_size=min(batch_size, 4096), n_clusters=n_clusters or INCREMENTAL_KMEANS_CLUSTERS)
+
+    classes = None
+    if model_type == "svm":
+        classes = _target_classes(collection_name, target_column, batch_size)
+        if classes is None or len(classes) < 2:
+            raise ValueError(f"The target column needs between 2 and {MAX_CLASSES} classes.")
+    binary_target = model_type == "linear_regression" and \
+        np.array_equal(_target_classes(collection_name, target_column, batch_size, limit=2), [0, 1])
+
+    profile = get_profile(collection_name)
+    total_rows = (profile or {}).get("row_count") or 0
+
+    def features(batch: pd.DataFrame):
+        X = batch.drop(columns=[target_column], errors="ignore")
+        if transform is not None:
+            X = transform.transform(X.reindex(columns=input_columns))
+        return X
+
+    fit_start = time.perf_counter()
+    train_rows = batch_count = 0
+    with span("incremental.fit"):
+        for epoch in range(epochs):
+            rows_seen = 0
+            for batch_index, batch in enumerate(iter_dataset_batches(collection_name, batch_size)):
+                batch = batch.dropna(subset=[target_column]) if target_column in batch else batch
+                train = batch[~_holdout_mask(len(batch), batch_index, holdout_fraction)]
+                rows_seen += len(batch)
+                if model_type == "k_means" and len(train) < model.n_clusters:
+                    continue
+                if len(train):
+                    X_train = features(train)
+                    if model_type == "k_means":
+                        model.partial_fit(X_train)
+                    elif classes is not None:
+                        model.partial_fit(X_train, train[target_column], classes=classes)
+                    else:
+                        model.partial_fit(X_train, train[target_column].astype(float))
+                    if epoch == 0:
+                        train_rows += len(train)
+                        batch_count += 1
+                if report and total_rows:
+                    # report raises JobCancelled, so cancellation takes effect between batches
+                    report("training", round(0.2 + 0.6 * (epoch + min(rows_seen / total_rows, 1)) / epochs, 3))
+    fit_time = time.perf_counter() - fit_start
+    if not train_rows:
+        raise ValueError("No rows to train on.")
+
+    # Scoring pass: the holdout rows of every batch, predicted by the final model
+    score_start = time.perf_counter()
+    regression = _RegressionScore()
+    classification = _ClassificationScore(classes if classes is not None else [0, 1])
+    inertia, sample, holdout_rows = 0.0, [], 0
+    rng = np.random.default_rng(42)
+    with span("incremental.score"):
+        for batch_index, batch in enumerate(iter_dataset_batches(collection_name, batch_size)):
+            batch = batch.dropna(subset=[target_column]) if target_column in batch else batch
+            holdout = batch[_holdout_mask(len(batch), batch_index, holdout_fraction)]
+            if not len(holdout):
+                continue
+            X_holdout = features(holdout)
+            if model_type == "k_means":
+                inertia -= model.score(X_holdout)
+                # Reservoir sample of holdout rows, the same bound the in-memory silhouette uses
+                for row in np.asarray(X_holdout):
+                    if len(sample) < SILHOUETTE_SAMPLE_ROWS:
+                        sample.append(row)
+                    else:
+                        slot = rng.integers(0, holdout_rows + 1)
+                        if slot < SILHOUETTE_SAMPLE_ROWS:
+                            sample[slot] = row
+                    holdout_rows += 1
+                continue
+            holdout_rows += len(holdout)
+            y_pred = model.predict(X_holdout)
+            if classes is not None:
+                classification.update(holdout[target_column], y_pred)
+            else:
+                regression.update(holdout[target_column], y_pred)
+                if binary_target:
+                    classification.update(holdout[target_column].astype(int), np.clip(np.round(y_pred), 0, 1).astype(int))
+
+    if model_type == "k_means":
+        sample = np.asarray(sample)
+        labels = model.predict(sample) if len(sample) else []
+        metrics = {
+            "silhouette_score": float(silhouette_score(sample, labels))
+            if len(set(labels)) > 1 else None,
+            "inertia": inertia / holdout_rows if holdout_rows else None,
+        }
+    elif classes is not None:
+        metrics = classification.result()
+    else:
+        metrics = regression.result()
+        if binary_target:
+            metrics.update(classification.result())
+
+    metrics.update({
+        "training_mode": "incremental",
+        "estimator": type(model).__name__,
+        "batch_size": batch_size,
+        "batches": batch_count,
+        "epochs": epochs,
+        "train_rows": train_rows,
+        "holdout_rows": holdout_rows,
+        "fit_time": round(fit_time, 4),
+        "score_time": round(time.perf_counter() - score_start, 4),
+    })
+
+    file_id, filename = save_model(model, model_type, metrics, collection_name)
+    return {**metrics, "file_id": file_id, "filename": filename}
+
+
+class IncrementalUpdate:
+    """Continues a saved partial_fit model on appended rows and saves the result as its next version.
+
+    Each batch is scored before the model learns from it, so the reported metrics come from rows the
+    model had not seen (prequential evaluation).
+    """
+
+    def __init__(self, model_doc: dict):
+        self.doc = model_doc
+        self.model_type = model_doc["model_type"]
+        # Copied so artifacts loaded memory-mapped (read-only) can be updated
+        self.model = copy.deepcopy(load_artifact(model_doc["_id"]))
+        if not hasattr(self.model, "partial_fit"):
+            raise ValueError(f"Model {model_doc['_id']} does not support partial_fit.")
+        classes = getattr(self.model, "classes_", None)
+        self.classifier = classes is not None
+        self.scores = _ClassificationScore(classes) if self.classifier else _RegressionScore()
+        self.inertia = 0.0
+        self.rows = self.skipped_rows = 0
+        self.fit_time = 0.0
+
+    def update(self, X, y=None):
+        start = time.perf_counter()
+        with span("incremental.update"):
+            self._update(X, y)
+        self.fit_time += time.perf_counter() - start
+
+    def _update(self, X, y):
+        if self.model_type == "k_means":
+            self.inertia -= self.model.score(X)
+            self.model.partial_fit(X)
+            self.rows += len(X)
+        else:
+            y = pd.Series(np.asarray(y))
+            keep = y.notna().to_numpy()
+            if self.classifier:
+                # partial_fit cannot add classes after the first call
+                keep = keep & y.isin(self.model.classes_.tolist()).to_numpy()
+            self.skipped_rows += int((~keep).sum())
+            if keep.any():
+                X, y = X[keep], y[keep]
+                target = y if self.classifier else y.astype(float)
+                self.scores.update(target, self.model.predict(X))
+                self.model.partial_fit(X, target)
+                self.rows += int(keep.sum())
+
+    def save(self) -> dict:
+        metrics = dict(self.doc.get("metrics") or {})
+        if self.model_type == "k_means":
+            metrics["inertia"] = self.inertia / self.rows if self.rows else metrics.get("inertia")
+        elif self.rows:
+            metrics.update(self.scores.result())
+        metrics.update({
+            "evaluation": "prequential",
+            "train_rows": (metrics.get("train_rows") or 0) + self.rows,
+            "appended_rows": self.rows,
+            "skipped_rows": self.skipped_rows,
+            "fit_time": round(self.fit_time, 4),
+        })
+        file_id, filename = save_model(self.model, self.model_type, metrics, self.doc.get("dataset"))
+        annotate_model(file_id, updated_from=str(self.doc["_id"]))
+        return {"file_id": file_id, "filename": filename, "updated_from": str(self.doc["_id"]),
+                "model_type": self.model_type, "rows": self.rows, "skipped_rows": self.skipped_rows}
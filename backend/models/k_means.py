@@ -1,22 +1,134 @@
-from sklearn.cluster import KMeans
+import os
+import time
+import numpy as np
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
 from utils.save_model import save_model
+from utils.instrumentation import span
 
-def train_kmeans(X, n_clusters=3):
-    model = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    cluster_labels = model.fit_predict(X)
+# Silhouette is O(n^2) in time and memory, so it is always scored on a bounded sample
+SILHOUETTE_SAMPLE_ROWS = int(os.getenv("SILHOUETTE_SAMPLE_ROWS", "5000"))
+KMEANS_MINIBATCH_ROWS = int(os.getenv("KMEANS_MINIBATCH_ROWS", "50000"))
+KMEANS_K_RANGE = tuple(int(k) for k in os.getenv("KMEANS_K_RANGE", "2-10").split("-"))
+KMEANS_SEARCH_WORKERS = int(os.getenv("KMEANS_SEARCH_WORKERS", str(os.cpu_count() or 1)))
 
-    silhouette_avg = silhouette_score(X, cluster_labels)
+SELECTION_METHODS = ("silhouette", "elbow")
+
+
+def build_kmeans(n_clusters: int, n_rows: int):
+    if n_rows > KMEANS_MINIBATCH_ROWS:
+        return MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3, batch_size=4096)
+    return KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+
+
+def sampled_silhouette(X, labels, sample_rows: int = SILHOUETTE_SAMPLE_ROWS):
+    if len(set(np.asarray(labels).tolist())) < 2:
+        return None
+    sample_size = min(len(labels), sample_rows)
+    return float(silhouette_score(X, labels, sample_size=sample_size, random_state=42))
+
+
+def _fit_k(X, k: int):
+    model = build_kmeans(k, len(X))
+    fit_start = time.perf_counter()
+    with span("kmeans.fit"):
+        labels = model.fit_predict(X)
+    fit_time = time.perf_counter() - fit_start
+
+    score_start = time.perf_counter()
+    with span("kmeans.silhouette"):
+        silhouette = sampled_silhouette(X, labels)
+    score_time = time.perf_counter() - score_start
+    return model, {
+        "k": k,
+        "inertia": float(model.inertia_),
+        "silhouette_score": silhouette,
+        "fit_time": round(fit_time, 4),
+        "score_time": round(score_time, 4),
+    }
+
+
+def _elbow(scores: list) -> int:
+    # The k farthest below the straight line joining the first and last inertia points
+    ks = np.array([s["k"] for s in scores], dtype=float)
+    inertia = np.array([s["inertia"] for s in scores])
+    if len(ks) < 3 or inertia[0] == inertia[-1]:
+        return scores[0]["k"]
+    x = (ks - ks[0]) / (ks[-1] - ks[0])
+    y = (inertia - inertia[-1]) / (inertia[0] - inertia[-1])
+    return scores[int(np.argmax((1 - x) - y))]["k"]
+
+
+def search_k(X, k_range: tuple = KMEANS_K_RANGE, method: str = "silhouette", workers: int = KMEANS_SEARCH_WORKERS,
+             time_budget: float = None):
+    """Fit every k in the inclusive range in parallel; returns (best k, its model, per-k scores).
+
+    With `time_budget` (seconds), the best k is chosen among the fits finished by then; fits not yet
+    started are skipped, and at least one k always finishes.
+    """
+    if method not in SELECTION_METHODS:
+        raise ValueError(f"Unknown k selection method '{method}'. Expected one of {SELECTION_METHODS}.")
+    low, high = k_range
+    ks = [k for k in range(max(low, 2), high + 1) if k < len(X)]
+    if not ks:
+        raise ValueError("Not enough rows to search for a cluster count.")
+
+    deadline = time.perf_counter() + time_budget if time_budget else None
+    # The heavy loops in KMeans release the GIL, so threads fit several k at once without copying X
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(ks))))
+    # Each task runs in a copy of this context so its spans still reach the request's collector
+    futures = [executor.submit(copy_context().run, _fit_k, X, k) for k in ks]
+    pending = set(futures)
+    while pending:
+        # Until one fit is done there is no k to return, so the first wait ignores the budget
+        timeout = None
+        if deadline is not None and len(pending) < len(futures):
+            timeout = max(0.0, deadline - time.perf_counter())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+    # Fits already running finish in the background; their results are not used
+    executor.shutdown(wait=False, cancel_futures=True)
+    fitted = [future.result() for future in futures if future.done() and not future.cancelled()]
+
+    scores = [score for _, score in fitted]
+    if method == "silhouette" and any(s["silhouette_score"] is not None for s in scores):
+        best_k = max((s for s in scores if s["silhouette_score"] is not None), key=lambda s: s["silhouette_score"])["k"]
+    else:
+        best_k = _elbow(scores)
+    model = next(model for model, score in fitted if score["k"] == best_k)
+    return best_k, model, scores
+
+
+def train_kmeans(X, n_clusters=None, dataset=None, k_range=KMEANS_K_RANGE, selection="silhouette",
+                 time_budget: float = None):
+    search_start = time.perf_counter()
+    if n_clusters:
+        model, best = _fit_k(X, n_clusters)
+        k_search = None
+    else:
+        n_clusters, model, k_search = search_k(X, k_range, selection, time_budget=time_budget)
+        best = next(score for score in k_search if score["k"] == n_clusters)
 
     metrics = {
-        "silhouette_score": silhouette_avg,
+        "silhouette_score": best["silhouette_score"],
+        "inertia": best["inertia"],
+        "n_clusters": n_clusters,
+        "algorithm": type(model).__name__,
+        "k_selection": selection if k_search else None,
+        "k_search": k_search,
         "accuracy": None,
         "precision": None,
         "recall": None,
         "f1_score": None,
         "confusion_matrix": None,
-        "feature_importance": None
+        "feature_importance": None,
+        "fit_time": best["fit_time"],
+        "score_time": best["score_time"],
+        "search_time": round(time.perf_counter() - search_start, 4) if k_search else None
     }
 
-    file_id, filename = save_model(model, "k_means", metrics)
+    file_id, filename = save_model(model, "k_means", metrics, dataset)
     return {**metrics, "file_id": file_id, "filename": filename}
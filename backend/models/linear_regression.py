@@ -1,47 +1,75 @@
+import time
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split, cross_val_predict
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import (
     mean_squared_error, r2_score, mean_absolute_error,
     accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
 )
+from models.cross_validation import prepare_folds, cross_validate, CV_N_JOBS
 from utils.save_model import save_model
+from utils.instrumentation import span
 
 
-def train_linear_regression(X, y, cross_validation=False):
-    model = LinearRegression()
-
-    if cross_validation:
-        y_pred = cross_val_predict(model, X, y, cv=5)
-        model.fit(X, y)
-        y_true = y
-    else:
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-        y_true = y_test
-
-    is_binary_classification = np.array_equal(np.unique(y), [0, 1])
+def _score(y_true, y_pred, is_binary_classification=False):
     metrics = {
         "rmse": float(np.sqrt(mean_squared_error(y_true, y_pred))),
         "r2": float(r2_score(y_true, y_pred)),
         "mae": float(mean_absolute_error(y_true, y_pred)),
-        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "accuracy": None,
     }
 
+    # Accuracy only means something when the regression output is rounded onto a 0/1 target
     if is_binary_classification:
-        y_pred_rounded = np.round(y_pred).astype(int)
-        y_true_int = y_true.astype(int)
+        y_pred_rounded = np.clip(np.round(y_pred), 0, 1).astype(int)
+        y_true_int = np.asarray(y_true).astype(int)
 
         metrics.update({
-            "accuracy": accuracy_score(y_true_int, y_pred_rounded),
-            "precision": precision_score(y_true_int, y_pred_rounded, average='macro', zero_division=0),
-            "recall": recall_score(y_true_int, y_pred_rounded, average='macro', zero_division=0),
-            "f1_score": f1_score(y_true_int, y_pred_rounded, average='macro', zero_division=0),
+            "accuracy": float(accuracy_score(y_true_int, y_pred_rounded)),
+            "precision": float(precision_score(y_true_int, y_pred_rounded, average='macro', zero_division=0)),
+            "recall": float(recall_score(y_true_int, y_pred_rounded, average='macro', zero_division=0)),
+            "f1_score": float(f1_score(y_true_int, y_pred_rounded, average='macro', zero_division=0)),
             "confusion_matrix": confusion_matrix(y_true_int, y_pred_rounded).tolist()
         })
+    return metrics
+
+
+def _binary_scorer(y_true, y_pred):
+    return _score(y_true, y_pred, True)
+
+
+def train_linear_regression(X, y, cross_validation=False, dataset=None, folds=None, params=None, n_jobs=CV_N_JOBS):
+    # Tuned parameters (alpha) come from the regularised variant
+    model = Ridge(**params) if params else LinearRegression()
+    is_binary_classification = np.array_equal(np.unique(y), [0, 1])
+    scorer = _binary_scorer if is_binary_classification else _score
+
+    fold_metrics = None
+    fit_start = time.perf_counter()
+    if cross_validation:
+        folds = folds or prepare_folds(X, y, dataset)
+        y_pred, fold_metrics = cross_validate(model, folds, scorer, n_jobs)
+        with span("linear_regression.fit"):
+            model.fit(X, y)
+        y_true = y
+        fit_time = time.perf_counter() - fit_start
+        score_start = time.perf_counter()
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42
+        )
+        with span("linear_regression.fit"):
+            model.fit(X_train, y_train)
+        fit_time = time.perf_counter() - fit_start
+        score_start = time.perf_counter()
+        with span("linear_regression.predict"):
+            y_pred = model.predict(X_test)
+        y_true = y_test
+
+    metrics = scorer(y_true, y_pred)
+    metrics["folds"] = fold_metrics
+    metrics["fit_time"] = round(fit_time, 4)
+    metrics["score_time"] = round(time.perf_counter() - score_start, 4)
 
-    file_id, filename = save_model(model, "linear_regression", metrics)
+    file_id, filename = save_model(model, "linear_regression", metrics, dataset)
     return {**metrics, "file_id": file_id, "filename": filename}
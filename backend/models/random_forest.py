@@ -1,68 +1,127 @@
-import pandas as pd
+import os
+import time
+import warnings
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-from preprocessing.preprocessor import detect_target_column
-from database.mongo import db
+from sklearn.ensemble import RandomForestRegressor, RandomForestClassifier
+from sklearn.metrics import (
+    mean_squared_error, r2_score, mean_absolute_error,
+    accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+)
 from utils.save_model import save_model
+from utils.instrumentation import span
+
+
+def _optional_number(name: str):
+    value = os.getenv(name)
+    if not value:
+        return None
+    return float(value) if "." in value else int(value)
+
+
+RF_N_JOBS = int(os.getenv("RF_N_JOBS", "-1"))
+RF_MAX_DEPTH = _optional_number("RF_MAX_DEPTH")
+RF_MAX_SAMPLES = _optional_number("RF_MAX_SAMPLES")  # Row count, or a fraction of the rows, per tree
+RF_MAX_ESTIMATORS = int(os.getenv("RF_MAX_ESTIMATORS", "300"))
+RF_GROWTH_STEP = int(os.getenv("RF_GROWTH_STEP", "25"))
+RF_OOB_TOLERANCE = float(os.getenv("RF_OOB_TOLERANCE", "0.001"))
 
 
 def calculate_accuracy(y_true, y_pred, threshold=0.05):
-    return np.mean(np.abs(y_true - y_pred) / y_true < threshold) * 100
+    # Share of predictions within `threshold` relative error, as a 0-1 fraction like every other accuracy
+    return np.mean(np.abs(y_true - y_pred) / y_true < threshold)
 
 
-def train_random_forest(collection_name: str, target_column: str = None, n_estimators: int = 100):
-    # Validate input
-    if not isinstance(collection_name, str) or not collection_name.strip():
-        raise ValueError("Invalid collection_name. Must be a non-empty string.")
+def _grow(model, X_train, y_train, max_estimators: int, step: int, tolerance: float):
+    # Add `step` trees at a time and stop once the OOB score stops improving by `tolerance`
+    trace = []
+    best = -np.inf
+    n_estimators = 0
+    while n_estimators < max_estimators:
+        n_estimators = min(n_estimators + step, max_estimators)
+        model.set_params(n_estimators=n_estimators)
+        with warnings.catch_warnings():
+            # The first few trees leave some rows without an OOB estimate
+            warnings.simplefilter("ignore", UserWarning)
+            model.fit(X_train, y_train)
+        score = float(model.oob_score_)
+        trace.append({"n_estimators": n_estimators, "oob_score": score})
+        if score - best < tolerance:
+            break
+        best = score
+    return trace
 
-    # Load dataset from MongoDB
-    df = pd.DataFrame(list(db[collection_name].find({}, {'_id': 0})))
-    if df.empty:
-        raise ValueError(f"No data found in collection '{collection_name}'.")
 
-    # Detect target column if not provided
-    if target_column is None:
-        target_column = detect_target_column(df)
-    if target_column not in df.columns:
-        raise ValueError(f"Target column '{target_column}' not found in collection '{collection_name}'.")
+def train_random_forest(X, y, dataset=None, max_estimators: int = RF_MAX_ESTIMATORS, max_depth=RF_MAX_DEPTH,
+                        max_samples=RF_MAX_SAMPLES, n_jobs: int = RF_N_JOBS, early_stopping: bool = True,
+                        params: dict = None):
+    if len(X) == 0:
+        raise ValueError("No data to train on.")
 
-    # Split features and target
-    X = df.drop(columns=[target_column])
-    y = df[target_column]
+    # Binary targets get a classifier; everything else stays a regression
+    is_binary_classification = np.array_equal(np.unique(y), [0, 1])
+    forest = RandomForestClassifier if is_binary_classification else RandomForestRegressor
 
-    # Train-test split
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
 
-    # Train model
-    model = RandomForestRegressor(n_estimators=n_estimators, random_state=42)
-    model.fit(X_train, y_train)
-
-    # Make predictions
-    y_pred = model.predict(X_test)
-
-    # Compute metrics
-    rmse = float(np.sqrt(mean_squared_error(y_test, y_pred)))
-    r2 = float(r2_score(y_test, y_pred))
-    mae = float(mean_absolute_error(y_test, y_pred))
-    accuracy = float(calculate_accuracy(y_test, y_pred))
-    confusion_matrix = float(np.mean(y_test == y_pred))
-    
-
-    # Save model using GridFS
-    metrics = {
-        "rmse": rmse,
-        "r2": r2,
-        "mae": mae,
-        "accuracy": accuracy,
+    model = forest(
+        n_estimators=max_estimators,
+        max_depth=max_depth,
+        max_samples=max_samples,
+        n_jobs=n_jobs,
+        oob_score=early_stopping,
+        warm_start=early_stopping,
+        random_state=42,
+    )
+    if params:
+        model.set_params(**params)
+        max_depth = model.max_depth
+    fit_start = time.perf_counter()
+    if early_stopping:
+        with span("random_forest.fit"):
+            oob_trace = _grow(model, X_train, y_train, max_estimators, RF_GROWTH_STEP, RF_OOB_TOLERANCE)
+    else:
+        with span("random_forest.fit"):
+            model.fit(X_train, y_train)
+        oob_trace = None
+    fit_time = time.perf_counter() - fit_start
+
+    score_start = time.perf_counter()
+    with span("random_forest.predict"):
+        y_pred = model.predict(X_test)
+
+    if is_binary_classification:
+        metrics = {
+            "accuracy": float(accuracy_score(y_test, y_pred)),
+            "precision": float(precision_score(y_test, y_pred, average='macro', zero_division=0)),
+            "recall": float(recall_score(y_test, y_pred, average='macro', zero_division=0)),
+            "f1_score": float(f1_score(y_test, y_pred, average='macro', zero_division=0)),
+            "confusion_matrix": confusion_matrix(y_test, y_pred).tolist(),
+        }
+    else:
+        metrics = {
+            "rmse": float(np.sqrt(mean_squared_error(y_test, y_pred))),
+            "r2": float(r2_score(y_test, y_pred)),
+            "mae": float(mean_absolute_error(y_test, y_pred)),
+            "accuracy": float(calculate_accuracy(y_test, y_pred)),
+            "confusion_matrix": float(np.mean(y_test == y_pred)),
+        }
+
+    metrics.update({
+        "task": "classification" if is_binary_classification else "regression",
         "feature_importance": model.feature_importances_.tolist(),
-        "confusion_matrix": confusion_matrix.tolist() if hasattr(confusion_matrix, 'tolist') else confusion_matrix
-    }
+        "n_estimators": len(model.estimators_),
+        "oob_score": oob_trace[-1]["oob_score"] if oob_trace else None,
+        "oob_trace": oob_trace,
+        "max_depth": max_depth,
+        "max_samples": max_samples,
+        "fit_time": round(fit_time, 4),
+        "score_time": round(time.perf_counter() - score_start, 4)
+    })
 
-    file_id, filename = save_model(model, "random_forest", metrics)
+    file_id, filename = save_model(model, "random_forest", metrics, dataset)
 
     # Return results
     return {
@@ -1,30 +1,92 @@
-
-from sklearn.svm import SVC
-from sklearn.model_selection import train_test_split, cross_val_predict
+import os
+import time
+from sklearn.svm import SVC, LinearSVC
+from sklearn.kernel_approximation import Nystroem
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.pipeline import make_pipeline
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
+from models.cross_validation import prepare_folds, cross_validate, CV_N_JOBS
 from utils.save_model import save_model
+from utils.instrumentation import span
+
+# Kernel SVC is O(n^2)-O(n^3); above these row counts switch to cheaper approximations
+SVM_EXACT_MAX_ROWS = int(os.getenv("SVM_EXACT_MAX_ROWS", "10000"))
+SVM_NYSTROEM_MAX_ROWS = int(os.getenv("SVM_NYSTROEM_MAX_ROWS", "200000"))
+SVM_NYSTROEM_COMPONENTS = int(os.getenv("SVM_NYSTROEM_COMPONENTS", "300"))
+SVM_CALIBRATION_FOLDS = int(os.getenv("SVM_CALIBRATION_FOLDS", "3"))
+
+STRATEGIES = ("auto", "exact", "nystroem", "linear")
+
+
+def choose_strategy(n_rows: int, kernel: str = 'rbf') -> str:
+    if kernel == 'linear' or n_rows > SVM_NYSTROEM_MAX_ROWS:
+        return "linear"
+    return "exact" if n_rows <= SVM_EXACT_MAX_ROWS else "nystroem"
+
+
+def build_svm(strategy: str, kernel: str = 'rbf', n_rows: int = 0):
+    if strategy == "exact":
+        return SVC(kernel=kernel)
+    if strategy == "nystroem":
+        components = min(SVM_NYSTROEM_COMPONENTS, max(n_rows, 1))
+        return make_pipeline(Nystroem(kernel=kernel, n_components=components, random_state=42),
+                             LinearSVC(dual="auto", random_state=42))
+    return LinearSVC(dual="auto", random_state=42)
 
-def train_svm(X, y, test_size=0.2, cross_validation=False, kernel='rbf'):
-    model = SVC(kernel=kernel, probability=True)
 
+def _score(y_true, y_pred):
+    return {
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision_score(y_true, y_pred, average='macro', zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred, average='macro', zero_division=0)),
+        "f1_score": float(f1_score(y_true, y_pred, average='macro', zero_division=0)),
+        "confusion_matrix": confusion_matrix(y_true, y_pred).tolist(),
+    }
+
+
+def train_svm(X, y, test_size=0.2, cross_validation=False, kernel='rbf', dataset=None,
+              strategy="auto", calibrate=False, folds=None, params=None, n_jobs=CV_N_JOBS):
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown SVM strategy '{strategy}'. Expected one of {STRATEGIES}.")
+    if strategy == "auto":
+        strategy = choose_strategy(len(X), kernel)
+    model = build_svm(strategy, kernel, len(X))
+    if params:
+        model.set_params(**params)
+    if calibrate:
+        # Probabilities only on request: calibration refits the model once per fold
+        model = CalibratedClassifierCV(model, cv=SVM_CALIBRATION_FOLDS)
+
+    fold_metrics = None
+    fit_start = time.perf_counter()
     if cross_validation:
-        y_pred = cross_val_predict(model, X, y, cv=5)
-        model.fit(X, y)
+        folds = folds or prepare_folds(X, y, dataset)
+        y_pred, fold_metrics = cross_validate(model, folds, _score, n_jobs)
+        with span("svm.fit"):
+            model.fit(X, y)
         y_true = y
+        fit_time = time.perf_counter() - fit_start
+        score_start = time.perf_counter()
     else:
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
+        with span("svm.fit"):
+            model.fit(X_train, y_train)
+        fit_time = time.perf_counter() - fit_start
+        score_start = time.perf_counter()
+        with span("svm.predict"):
+            y_pred = model.predict(X_test)
         y_true = y_test
 
     metrics = {
-        "accuracy": accuracy_score(y_true, y_pred),
-        "precision": precision_score(y_true, y_pred, average='macro', zero_division=0),
-        "recall": recall_score(y_true, y_pred, average='macro', zero_division=0),
-        "f1_score": f1_score(y_true, y_pred, average='macro', zero_division=0),
-        "confusion_matrix": confusion_matrix(y_true, y_pred).tolist(),
-        "feature_importance": None
+        **_score(y_true, y_pred),
+        "feature_importance": None,
+        "folds": fold_metrics,
+        "svm_strategy": strategy,
+        "calibrated": calibrate,
+        "fit_time": round(fit_time, 4),
+        "score_time": round(time.perf_counter() - score_start, 4)
     }
 
-    file_id, filename = save_model(model, "svm", metrics)
+    file_id, filename = save_model(model, "svm", metrics, dataset)
     return {**metrics, "file_id": file_id, "filename": filename}
@@ -0,0 +1,165 @@
+import pandas as pd
+
+from database.datasets import load_dataset
+from models.linear_regression import train_linear_regression
+from models.random_forest import train_random_forest
+from models.k_means import train_kmeans
+from models.svm import train_svm
+from models.all import select_best_model  # Auto-selection logic
+from models.incremental import train_incremental, INCREMENTAL_BATCH_ROWS
+from models.tuning import tune, record_tuning, TUNABLE, TUNING_TIME_BUDGET
+from utils.artifacts import load_artifact
+from utils.jobs import commit_job
+from utils.memo import save_memoized_training
+from utils.pipelines import get_preprocessing, get_source_preprocessing, save_full_pipeline, PIPELINE_BUCKET
+from utils.profile import get_profile
+
+
+def _noop_report(stage: str, progress: float):
+    pass
+
+
+def _run_incremental(collection_name: str, model_type: str, batch_size: int, n_clusters: int, report):
+    preprocessing = get_preprocessing(collection_name)
+    transform = None
+    if preprocessing is None:
+        # Raw dataset: push each batch through the pipeline its latest preprocessing run fitted
+        preprocessing = get_source_preprocessing(collection_name)
+        if preprocessing is None:
+            raise ValueError("Incremental training needs a processed dataset, or a raw dataset that has been preprocessed.")
+        transform = load_artifact(preprocessing["file_id"], PIPELINE_BUCKET)
+
+    result = train_incremental(collection_name, model_type, preprocessing["target_column"], transform=transform,
+                               input_columns=preprocessing["input_columns"], batch_size=batch_size,
+                               n_clusters=n_clusters, report=report)
+    return result, preprocessing
+
+
+def run_training(collection_name: str, model_type: str, auto_model_selection: bool, report=_noop_report,
+                 incremental: bool = False, batch_size: int = None, calibrate: bool = False,
+                 n_clusters: int = None, cross_validation: bool = False, tune_models: bool = False,
+                 tuning_budget: float = None, memo_key: str = None):
+    options = {"incremental": incremental, "batch_size": batch_size, "calibrate": calibrate, "n_clusters": n_clusters,
+               "cross_validation": cross_validation, "tune_models": tune_models, "tuning_budget": tuning_budget}
+    summary = _train(collection_name, model_type, auto_model_selection, report, **options)
+    if memo_key:
+        save_memoized_training(memo_key, collection_name,
+                               training_config(model_type, auto_model_selection, **options), summary)
+    return summary
+
+
+def training_config(model_type: str, auto_model_selection: bool, **options):
+    """Everything that decides a training result, besides the data and the code."""
+    # Auto selection ignores the requested model type
+    return {"model_type": None if auto_model_selection else model_type,
+            "auto_model_selection": auto_model_selection, **options}
+
+
+def _train(collection_name: str, model_type: str, auto_model_selection: bool, report, incremental: bool,
+           batch_size: int, calibrate: bool, n_clusters: int, cross_validation: bool, tune_models: bool,
+           tuning_budget: float):
+    if incremental:
+        if auto_model_selection:
+            raise ValueError("Automatic model selection is not available in incremental mode.")
+        report("streaming_dataset", 0.05)
+        result, preprocessing = _run_incremental(collection_name, model_type, batch_size or INCREMENTAL_BATCH_ROWS,
+                                                 n_clusters, report)
+        return _summary(model_type, result, preprocessing, report)
+
+    report("loading_dataset", 0.05)
+    df = load_dataset(collection_name)
+    if df.empty:
+        raise ValueError("No data found in the specified collection.")
+
+    # Use the target chosen at preprocessing time when this is a processed dataset
+    preprocessing = get_preprocessing(collection_name)
+    target = preprocessing["target_column"] if preprocessing else detect_target_column(df, get_profile(collection_name))
+    X = df.drop(columns=[target])
+    y = df[target]
+
+    # Train model
+    report("training", 0.2)
+    if auto_model_selection:
+        result = select_best_model(
+            collection_name,
+            test_size=0.2,
+            cross_validation=cross_validation,
+            tune_models=tune_models,
+            target_column=target,
+        )
+        # The candidates saved their models in their own workers; the job is past cancelling now
+        commit_job("saving_model", check=False)
+        model_name = result["best_model"]
+    else:
+        model_name = model_type
+        tuning = None
+        if tune_models and model_name in TUNABLE:
+            report("tuning", 0.25)
+            tuning = tune(model_name, X, y, tuning_budget or TUNING_TIME_BUDGET)
+            report("training", 0.6)
+        params = tuning["params"] if tuning else None
+
+        if model_name == "random_forest":
+            result = train_random_forest(X, y, dataset=collection_name, params=params)
+        elif model_name == "svm":
+            result = train_svm(X, y, cross_validation=cross_validation, dataset=collection_name, calibrate=calibrate,
+                               params=params)
+        elif model_name == "linear_regression":
+            result = train_linear_regression(X, y, cross_validation, dataset=collection_name, params=params)
+        elif model_name == "k_means":
+            result = train_kmeans(X, n_clusters, dataset=collection_name)
+        else:
+            raise ValueError("Unsupported model type.")
+
+        if tuning:
+            result["tuning"] = record_tuning(result["file_id"], tuning)
+
+    return _summary(model_name, result, preprocessing, report)
+
+
+def _summary(model_name: str, result: dict, preprocessing: dict, report):
+    # The model is stored by now, so this only records progress; cancelling stopped at the save
+    report("saving_results", 0.95)
+    metrics = result.get("metrics", result)
+
+    # Bundle the fitted preprocessing with the model so it can score raw rows
+    pipeline_file_id = None
+    if preprocessing:
+        pipeline_file_id = save_full_pipeline(str(result.get("file_id")), preprocessing)
+
+    return {
+        "message": "Model trained and saved successfully.",
+        "model_type": model_name,
+        "file_id": str(result.get("file_id")),
+        "filename": result.get("filename"),
+        "pipeline_file_id": pipeline_file_id,
+        "metrics": {
+            "rmse": metrics.get("rmse"),
+            "mae": metrics.get("mae"),
+            "r2": metrics.get("r2"),
+            "accuracy": metrics.get("accuracy"),
+            "fit_time": metrics.get("fit_time"),
+            "score_time": metrics.get("score_time"),
+            "training_mode": metrics.get("training_mode", "in_memory"),
+            "folds": metrics.get("folds"),
+        },
+        "tuning": result.get("tuning") or result.get("metrics", {}).get("tuning"),
+        "candidates": result.get("candidates")
+    }
+
+
+def detect_target_column(df: pd.DataFrame, profile: dict = None):
+    if df.empty:
+        raise ValueError("Dataframe is empty. Cannot detect target column.")
+
+    if profile:
+        # Distinct counts from the ingest-time profile; no full nunique() pass
+        unique_counts = pd.Series({
+            column["name"]: column["distinct"] for column in profile["columns"] if column["name"] in df.columns
+        }).sort_values()
+    else:
+        unique_counts = df.nunique().sort_values()
+    for col, count in unique_counts.items():
+        if 1 < count < len(df):
+            return col
+    raise ValueError("No suitable target column found.")
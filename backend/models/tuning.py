@@ -0,0 +1,140 @@
+import os
+import time
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import loguniform
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import KFold, StratifiedKFold, ParameterSampler, cross_val_score
+
+from database.registry import annotate_model
+from models.cross_validation import is_classification_target
+from models.svm import build_svm, choose_strategy
+from utils.instrumentation import span
+
+TUNING_TIME_BUDGET = float(os.getenv("TUNING_TIME_BUDGET", "300"))
+TUNING_CANDIDATES = int(os.getenv("TUNING_CANDIDATES", "27"))
+TUNING_FACTOR = int(os.getenv("TUNING_FACTOR", "3"))
+TUNING_MIN_ROWS = int(os.getenv("TUNING_MIN_ROWS", "500"))
+TUNING_CV = 3
+TUNING_N_JOBS = int(os.getenv("TUNING_N_JOBS", "-1"))
+
+SVM_SPACES = {
+    "exact": {"C": loguniform(1e-2, 1e3), "gamma": loguniform(1e-4, 1e1)},
+    "nystroem": {"nystroem__gamma": loguniform(1e-4, 1e1), "linearsvc__C": loguniform(1e-2, 1e3)},
+    "linear": {"C": loguniform(1e-3, 1e2)},
+}
+RANDOM_FOREST_SPACE = {
+    "max_depth": [None, 6, 12, 24],
+    "min_samples_leaf": [1, 2, 5, 10],
+    "max_features": ["sqrt", 0.5, 1.0],
+}
+LINEAR_SPACE = {"alpha": loguniform(1e-6, 1e2)}
+
+TUNABLE = ("linear_regression", "svm", "random_forest")
+
+
+def search_space(model_type: str, X, y):
+    """(base estimator, parameter distributions, scoring) for a model type, matching what its trainer fits."""
+    if model_type == "linear_regression":
+        # LinearRegression has nothing to tune; its regularised form does
+        return Ridge(), LINEAR_SPACE, "r2"
+    if model_type == "svm":
+        strategy = choose_strategy(len(X))
+        return build_svm(strategy, n_rows=len(X)), SVM_SPACES[strategy], "accuracy"
+    if model_type == "random_forest":
+        if np.array_equal(np.unique(y), [0, 1]):
+            return RandomForestClassifier(n_estimators=100, random_state=42), RANDOM_FOREST_SPACE, "accuracy"
+        return RandomForestRegressor(n_estimators=100, random_state=42), RANDOM_FOREST_SPACE, "r2"
+    raise ValueError(f"Tuning supports {list(TUNABLE)}, not '{model_type}'.")
+
+
+def _evaluate(estimator, params, X, y, cv, scoring):
+    start = time.perf_counter()
+    try:
+        score = float(np.mean(cross_val_score(clone(estimator).set_params(**params), X, y, cv=cv, scoring=scoring)))
+    except ValueError:
+        score = -np.inf
+    return params, (score, time.perf_counter() - start)
+
+
+def tune(model_type: str, X, y, time_budget: float = TUNING_TIME_BUDGET, n_candidates: int = TUNING_CANDIDATES,
+         factor: int = TUNING_FACTOR, min_rows: int = TUNING_MIN_ROWS, n_jobs: int = TUNING_N_JOBS,
+         deadline: float = None):
+    """Successive halving over sampled parameters with rows as the resource.
+
+    Each round scores the surviving candidates on `factor` times more rows and keeps the best
+    1/factor; a round is only started if it is expected to finish inside the wall-clock budget, and
+    one that runs past it is cut short and ranked on the candidates scored so far. `deadline` is an
+    absolute time.perf_counter() value that replaces `time_budget`. Returns None when the budget
+    runs out before any candidate is scored.
+    """
+    estimator, space, scoring = search_space(model_type, X, y)
+    X, y = np.asarray(X), np.asarray(y)
+    stratified = is_classification_target(y) and np.unique(y, return_counts=True)[1].min() >= TUNING_CV
+    cv = (StratifiedKFold if stratified else KFold)(n_splits=TUNING_CV, shuffle=True, random_state=42)
+
+    candidates = list(ParameterSampler(space, n_iter=n_candidates, random_state=42))
+    order = np.random.default_rng(42).permutation(len(X))
+    rows = min(max(min_rows, len(X) // factor ** 3), len(X))
+
+    start = time.perf_counter()
+    deadline = deadline if deadline is not None else start + time_budget
+    trace = []
+    ranked = []
+    while time.perf_counter() < deadline:
+        subset = order[:rows]
+        round_start = time.perf_counter()
+        scored = []
+        with span("tune.round"):
+            evaluations = Parallel(n_jobs=n_jobs, return_as="generator_unordered")(
+                delayed(_evaluate)(estimator, params, X[subset], y[subset], cv, scoring) for params in candidates
+            )
+            for evaluation in evaluations:
+                scored.append(evaluation)
+                if time.perf_counter() > deadline:
+                    break
+            # Drops evaluations not started yet once the round is cut short
+            evaluations.close()
+        last_round = time.perf_counter() - round_start
+        if not scored:
+            break
+        ranked = sorted(scored, key=lambda item: item[1][0], reverse=True)
+        trace.append({
+            "round": len(trace),
+            "rows": int(rows),
+            "candidates": [{"params": params, "score": score if np.isfinite(score) else None, "time": round(elapsed, 4)}
+                           for params, (score, elapsed) in ranked],
+            "time": round(last_round, 4),
+        })
+
+        cut_short = len(scored) < len(candidates)
+        survivors = max(1, len(candidates) // factor)
+        candidates = [params for params, _ in ranked[:survivors]]
+        if rows >= len(X) or len(ranked) == 1 or cut_short:
+            break
+        # Halving keeps rounds roughly equal in cost; leave room for one costing `factor` times more
+        if time.perf_counter() + last_round * factor > deadline:
+            break
+        rows = min(rows * factor, len(X))
+
+    if not ranked:
+        return None
+    best_params, (best_score, _) = ranked[0]
+    return {
+        "params": best_params,
+        "score": best_score if np.isfinite(best_score) else None,
+        "scoring": scoring,
+        "estimator": type(estimator).__name__,
+        "rounds": len(trace),
+        "budget": round(deadline - start, 4),
+        "elapsed": round(time.perf_counter() - start, 4),
+        "trace": trace,
+    }
+
+
+def record_tuning(file_id: str, tuning: dict):
+    """Store the winning parameters and search trace on the model's registry record; returns a short summary."""
+    annotate_model(file_id, params=tuning["params"], tuning=tuning)
+    return {key: tuning[key] for key in ("params", "score", "scoring", "estimator", "rounds", "elapsed")}
@@ -1,14 +1,41 @@
 import pandas as pd
+import numpy as np
 import os
+import time
 from datetime import datetime
+from functools import partial
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, RobustScaler
+from sklearn.preprocessing import OneHotEncoder, RobustScaler, FunctionTransformer
 from sklearn.impute import SimpleImputer
-from sklearn.feature_selection import SelectKBest, mutual_info_classif, mutual_info_regression
-from sklearn.decomposition import PCA
+from sklearn.feature_selection import (
+    SelectKBest, mutual_info_classif, mutual_info_regression, f_classif, f_regression
+)
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
+from bson import ObjectId
 from database.mongo import db
+from database.datasets import save_columnar, mark_dataset_written, COLUMNAR_STORAGE
+from utils.pipelines import save_preprocessing
+from utils.ingest import insert_in_batches
+from database.registry import register_dataset, datasets_registry
+from utils.instrumentation import span
+from utils.jobs import TRAINING_EXECUTOR
+from utils.memo import memo_key, dataset_hash, CODE_VERSION
+from utils.profile import profile_dataframe, get_profile
+
+# Categorical columns with more distinct values than this are frequency-encoded instead of one-hot
+HIGH_CARDINALITY_THRESHOLD = int(os.getenv("HIGH_CARDINALITY_THRESHOLD", "1000"))
+
+# Fast feature selection: MI on a stratified sample, after an F-test pre-screen
+FAST_MI_SAMPLE_ROWS = int(os.getenv("FAST_MI_SAMPLE_ROWS", "20000"))
+FAST_PRESCREEN_FACTOR = int(os.getenv("FAST_PRESCREEN_FACTOR", "5"))
+INCREMENTAL_PCA_ROWS = int(os.getenv("INCREMENTAL_PCA_ROWS", "500000"))
+
+# Processed outputs can skip the row documents and live only as the columnar blob
+PROCESSED_ROW_DOCUMENTS = not COLUMNAR_STORAGE or os.getenv("PROCESSED_ROW_DOCUMENTS", "true").lower() not in ("0", "false", "no")
 
 # Load dataset
 def load_data(file_path):
@@ -23,7 +50,10 @@ def load_data(file_path):
     return df
 
 # Detect Target Column
-def detect_target_column(df):
+def detect_target_column(df, profile=None):
+    if profile:
+        return detect_target_column_from_profile(df, profile)
+
     numeric_cols = df.select_dtypes(include=['number']).columns
     numeric_cols = [col for col in numeric_cols if 'id' not in col.lower()]
 
@@ -33,8 +63,51 @@ def detect_target_column(df):
 
     return df[numeric_cols].var().idxmax() if numeric_cols else df.columns[-1]
 
+
+# Same rule as above, read from the ingest-time profile instead of rescanning the data
+def detect_target_column_from_profile(df, profile):
+    stats = {column["name"]: column for column in profile["columns"] if column["name"] in df.columns}
+    numeric_cols = [col for col in df.select_dtypes(include=['number']).columns
+                    if 'id' not in col.lower() and col in stats]
+
+    for col in numeric_cols:
+        if stats[col]["distinct"] == 2:
+            return col  # Binary classification
+
+    variances = {col: stats[col]["variance"] for col in numeric_cols if stats[col]["variance"] is not None}
+    return max(variances, key=variances.get) if variances else df.columns[-1]
+
+# Encodes each category by its relative frequency in the training data: one column per feature
+class FrequencyEncoder(BaseEstimator, TransformerMixin):
+    def fit(self, X, y=None):
+        X = pd.DataFrame(X)
+        self.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        self.frequencies_ = [
+            X[col].fillna("__missing__").astype(str).value_counts(normalize=True).to_dict()
+            for col in X.columns
+        ]
+        return self
+
+    def transform(self, X):
+        X = pd.DataFrame(X)
+        columns = [
+            X[col].fillna("__missing__").astype(str).map(frequencies).fillna(0.0).to_numpy(dtype=float)
+            for col, frequencies in zip(X.columns, self.frequencies_)
+        ]
+        return np.column_stack(columns) if columns else np.empty((len(X), 0))
+
+    def get_feature_names_out(self, input_features=None):
+        names = input_features if input_features is not None else self.feature_names_in_
+        return np.asarray([f"{name}_freq" for name in names], dtype=object)
+
+
+def _densify(X):
+    return X.toarray() if sparse.issparse(X) else X
+
+
 # Preprocessing Pipeline
-def build_preprocessing_pipeline(df, target_column, top_n_categories=5, k=10, use_pca=True, pca_components=5):
+def build_preprocessing_pipeline(df, target_column, top_n_categories=5, k=10, use_pca=True, pca_components=5,
+                                 profile=None):
     # Identify column types
     numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
     categorical_cols = df.select_dtypes(
@@ -44,8 +117,16 @@ def build_preprocessing_pipeline(df, target_column, top_n_categories=5, k=10, us
         numeric_cols.remove(target_column)
     if target_column in categorical_cols:
         categorical_cols.remove(target_column)
-        
-    # Handle categorical columns with high cardinality
+
+    # Handle categorical columns with high cardinality: ID-like columns get one frequency
+    # column, the rest keep their top_n_categories plus a single "infrequent" bucket
+    distinct = {column["name"]: column["distinct"] for column in profile["columns"]} if profile else {}
+    high_cardinality_cols = [
+        col for col in categorical_cols
+        if (distinct[col] if col in distinct else df[col].nunique()) > HIGH_CARDINALITY_THRESHOLD
+    ]
+    categorical_cols = [col for col in categorical_cols if col not in high_cardinality_cols]
+
     num_pipeline = Pipeline([
         ("imputer", SimpleImputer(strategy="mean")),
         ("scaler", RobustScaler()),
@@ -53,89 +134,251 @@ def build_preprocessing_pipeline(df, target_column, top_n_categories=5, k=10, us
 
     cat_pipeline = Pipeline([
         ("imputer", SimpleImputer(strategy="most_frequent")),
-        ("onehot", OneHotEncoder(handle_unknown="ignore", sparse_output=False)),
+        ("onehot", OneHotEncoder(handle_unknown="infrequent_if_exist", max_categories=top_n_categories + 1,
+                                 sparse_output=True)),
     ])
-    
-    # Column Transformer
+
+    # Column Transformer; stays sparse whenever the one-hot block is present
     preprocessor = ColumnTransformer([
         ("num", num_pipeline, numeric_cols),
         ("cat", cat_pipeline, categorical_cols),
-    ], remainder="drop")
+        ("freq", FrequencyEncoder(), high_cardinality_cols),
+    ], remainder="drop", sparse_threshold=1.0)
+
+    return preprocessor, numeric_cols, categorical_cols + high_cardinality_cols
+
+
+# Mutual information on a mixed sparse matrix: one-hot columns are scored as discrete
+# (kept sparse), the remaining columns as continuous
+def mutual_info_scores(X, y, discrete_mask, regression, random_state=42):
+    score_func = mutual_info_regression if regression else mutual_info_classif
+    discrete_mask = np.asarray(discrete_mask, dtype=bool)
+    scores = np.zeros(X.shape[1])
+    if (~discrete_mask).any():
+        scores[~discrete_mask] = score_func(_densify(X[:, ~discrete_mask]), y, discrete_features=False,
+                                            random_state=random_state)
+    if discrete_mask.any():
+        scores[discrete_mask] = score_func(X[:, discrete_mask], y, discrete_features=True,
+                                           random_state=random_state)
+    return scores
+
+def stratified_sample_indices(y, sample_size, regression, random_state=42):
+    y = np.asarray(y)
+    if len(y) <= sample_size:
+        return np.arange(len(y))
+    # Regression targets are stratified on quantile bins
+    strata = pd.qcut(y, q=10, labels=False, duplicates="drop") if regression else y
+    try:
+        indices, _ = train_test_split(np.arange(len(y)), train_size=sample_size,
+                                      stratify=strata, random_state=random_state)
+    except ValueError:  # A stratum too small to split; fall back to a plain random sample
+        indices = np.random.default_rng(random_state).choice(len(y), sample_size, replace=False)
+    return np.sort(indices)
+
+
+# Mutual information on a stratified row sample, computed only for the columns that
+# survive a vectorized F-test pre-screen; screened-out columns score -1
+def fast_mutual_info_scores(X, y, discrete_mask, regression, k, sample_size=FAST_MI_SAMPLE_ROWS,
+                            prescreen_factor=FAST_PRESCREEN_FACTOR, random_state=42):
+    indices = stratified_sample_indices(y, sample_size, regression, random_state)
+    X_sample = (X.tocsr() if sparse.issparse(X) else X)[indices]
+    y_sample = np.asarray(y)[indices]
+
+    keep = np.arange(X.shape[1])
+    if X.shape[1] > k * prescreen_factor:
+        f_scores, _ = (f_regression if regression else f_classif)(X_sample, y_sample)
+        keep = np.sort(np.argsort(np.nan_to_num(f_scores, nan=0.0))[::-1][:k * prescreen_factor])
+
+    X_kept = X_sample[:, keep]
+    if sparse.issparse(X_kept):
+        X_kept = X_kept.tocsc()
+    scores = np.full(X.shape[1], -1.0)
+    scores[keep] = mutual_info_scores(X_kept, y_sample, np.asarray(discrete_mask)[keep], regression, random_state)
+    return scores
+
+
+def build_pca(n_components, n_rows, fast=False):
+    if not fast:
+        return PCA(n_components=n_components)
+    if n_rows > INCREMENTAL_PCA_ROWS:
+        return IncrementalPCA(n_components=n_components, batch_size=max(10 * n_components, 10000))
+    return PCA(n_components=n_components, svd_solver="randomized", random_state=42)
 
-    return preprocessor, numeric_cols, categorical_cols
 
 # Feature Selection
-def select_features(X, y, k=10, use_pca=True, pca_components=5):
-    if y.nunique() > 10:    # Regression task
-        selector = SelectKBest(
-            score_func=mutual_info_regression, k=min(k, X.shape[1]))
-    else:   # Classification task
-        selector = SelectKBest(
-            score_func=mutual_info_classif, k=min(k, X.shape[1]))
-
-    X_selected = selector.fit_transform(X, y)
-    selected_features = X.columns[selector.get_support()]
-
-    print(f"Selected Features: {list(selected_features)}")
-    print(f"Number of Selected Features: {len(selected_features)}")
-    print(f"Target: {y.name}")
-
-    X = pd.DataFrame(X_selected, columns=selected_features)
+def select_features(X, y, k=10, use_pca=True, pca_components=5, feature_names=None, discrete_mask=None,
+                    fast=False, compare_exact=False):
+    if feature_names is None:
+        feature_names = np.asarray(X.columns)
+        X = X.to_numpy()
+    if discrete_mask is None:
+        discrete_mask = np.zeros(X.shape[1], dtype=bool)
+
+    start = time.perf_counter()
+    regression = y.nunique() > 10   # Regression task, otherwise classification
+    k = min(k, X.shape[1])
+    exact_score_func = partial(mutual_info_scores, discrete_mask=discrete_mask, regression=regression)
+    if fast:
+        score_func = partial(fast_mutual_info_scores, discrete_mask=discrete_mask, regression=regression, k=k)
+    else:
+        score_func = exact_score_func
+    selector = SelectKBest(score_func=score_func, k=k)
 
+    # X may be sparse; only the k selected columns are ever densified
+    X_input = X
+    with span("preprocess.mutual_info"):
+        X_selected = _densify(selector.fit_transform(X, y))
+    selected_features = np.asarray(feature_names)[selector.get_support()]
 
+    pca = None
     if use_pca:
-        pca = PCA(n_components=min(pca_components, X.shape[1]))
-        X = pd.DataFrame(pca.fit_transform(X), columns=[
-                         f'pca_{i+1}' for i in range(min(pca_components, X.shape[1]))])
-
-    return X
-
-
-def preprocess_data(df, target_column, top_n_categories=5, k=10, use_pca=True, pca_components=5):
+        pca = build_pca(min(pca_components, X_selected.shape[1]), X_selected.shape[0], fast)
+        with span("preprocess.pca"):
+            X = pd.DataFrame(pca.fit_transform(X_selected), columns=[
+                             f'pca_{i+1}' for i in range(pca.n_components)])
+    else:
+        X = pd.DataFrame(X_selected, columns=selected_features)
+
+    report = {
+        "mode": "fast" if fast else "exact",
+        "selected_features": [str(name) for name in selected_features],
+        "n_input_features": len(feature_names),
+        "selection_time": round(time.perf_counter() - start, 4),
+        "pca": type(pca).__name__ if pca is not None else None,
+    }
+    if fast:
+        report["sample_rows"] = int(min(len(y), FAST_MI_SAMPLE_ROWS))
+        report["prescreened_features"] = int(min(len(feature_names), k * FAST_PRESCREEN_FACTOR))
+    if fast and compare_exact:
+        # Costs a full exact MI pass; only for checking that fast mode picks the same features
+        exact_support = SelectKBest(score_func=exact_score_func, k=k).fit(X_input, y).get_support()
+        overlap = np.logical_and(exact_support, selector.get_support()).sum()
+        report["exact_selected_features"] = [str(name) for name in np.asarray(feature_names)[exact_support]]
+        report["overlap_with_exact"] = round(float(overlap) / k, 4) if k else 1.0
+
+    return X, selector, pca, report
+
+
+def preprocess_data(df, target_column, top_n_categories=5, k=10, use_pca=True, pca_components=5, profile=None,
+                    fast=False, compare_exact=False):
     preprocessor, numeric_cols, categorical_cols = build_preprocessing_pipeline(
-        df, target_column, top_n_categories, k, use_pca, pca_components
+        df, target_column, top_n_categories, k, use_pca, pca_components, profile
     )
 
     X = df.drop(columns=[target_column])
     y = df[target_column]
 
-    X_transformed = preprocessor.fit_transform(X)
-    
-    # Convert back to DataFrame
-    X_transformed = pd.DataFrame(X_transformed)
-    
+    # Stays a sparse matrix when one-hot columns are present
+    with span("preprocess.fit_transform"):
+        X_transformed = preprocessor.fit_transform(X)
+    if sparse.issparse(X_transformed):
+        X_transformed = X_transformed.tocsc()   # Column slicing for selection
+    feature_names = preprocessor.get_feature_names_out()
+    discrete_mask = np.char.startswith(feature_names.astype(str), "cat__")
+
     # Apply Feature Selection
-    X_transformed = select_features(
-        X_transformed, y, k=k, use_pca=use_pca, pca_components=pca_components)
+    X_transformed, selector, pca, report = select_features(
+        X_transformed, y, k=k, use_pca=use_pca, pca_components=pca_components,
+        feature_names=feature_names, discrete_mask=discrete_mask, fast=fast, compare_exact=compare_exact)
 
-    return X_transformed, y
+    # Keep the fitted steps so raw rows can be transformed the same way later
+    steps = [("preprocess", preprocessor), ("select", selector), ("densify", FunctionTransformer(_densify))]
+    if pca is not None:
+        steps.append(("pca", pca))
+
+    return X_transformed, y, Pipeline(steps), report
 
 # Split Data
 def split_data(X, y):
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     return X_train, X_test, y_train, y_test
 
+# Everything that changes the processed output; hashed into the collection name
+def preprocessing_config(target_column=None, manual_features=None, top_n_categories=5, k=10, use_pca=True,
+                         pca_components=5, fast=False):
+    config = {
+        "target_column": target_column,
+        "manual_features": sorted(manual_features) if manual_features else None,
+        "top_n_categories": top_n_categories,
+        "k": k,
+        "use_pca": use_pca,
+        "pca_components": pca_components,
+        "high_cardinality_threshold": HIGH_CARDINALITY_THRESHOLD,
+        "fast": fast,
+    }
+    if fast:
+        config.update({"fast_sample_rows": FAST_MI_SAMPLE_ROWS, "fast_prescreen_factor": FAST_PRESCREEN_FACTOR})
+    return config
+
+
+def processed_dataset_name(source_collection: str, config: dict):
+    # Same source content + same config + same code -> same memo key, so reruns are a lookup
+    key = memo_key(source_collection, config)
+    lineage = {"source": source_collection, "source_hash": dataset_hash(source_collection), "config": config,
+               "code_version": CODE_VERSION, "memo_key": key}
+    return f"processed_{source_collection}_{key[:16]}", lineage
+
+
+def get_processed_dataset(collection_name: str, key: str = None):
+    query = {"kind": "processed", "status": "complete"}
+    found = datasets_registry.find_one({**query, "_id": collection_name})
+    if found is None and key:
+        # Identical content preprocessed under another source name
+        found = datasets_registry.find_one({**query, "lineage.memo_key": key}, sort=[("created_at", 1)])
+    return found
+
+
 # Save Processed Data
-def save_processed_data(X, y):
+def save_processed_data(X, y, source_collection: str = None, collection_name: str = None, lineage: dict = None):
     df = pd.concat([X, y.reset_index(drop=True)], axis=1)
-    timestamp = datetime.now().strftime('%d%m%Y_%H%M%S')
-    collection_name = f"processed_{timestamp}"
-    db[collection_name].insert_many(df.to_dict(orient="records"))
+    if collection_name is None:
+        timestamp = datetime.now().strftime('%d%m%Y_%H%M%S')
+        collection_name = f"processed_{timestamp}"
+
+    if PROCESSED_ROW_DOCUMENTS:
+        # Batched unordered inserts into a private staging collection, then an atomic rename,
+        # so concurrent runs for the same name never interleave rows. The ObjectId suffix dates the
+        # staging collection even while it is still empty, for garbage collection
+        staging = db[f"{collection_name}__staging_{ObjectId()}"]
+        insert_in_batches(staging, df)
+        staging.rename(collection_name, dropTarget=True)
+    save_columnar(collection_name, df)
+    # Prime this process's cache only when training jobs run in it; worker processes have their own
+    mark_dataset_written(collection_name, df if TRAINING_EXECUTOR == "thread" else None)
+    profile_dataframe(collection_name, df)
+    register_dataset(collection_name, "processed", source=source_collection, row_count=len(df),
+                     target_column=y.name, columns=df.columns.astype(str).tolist(), lineage=lineage,
+                     content_hash=lineage["memo_key"] if lineage else None, row_documents=PROCESSED_ROW_DOCUMENTS)
     print(f"Processed data saved in MongoDB collection: '{collection_name}'")
     return collection_name
 
 
-def preprocess_dataset_from_mongo(df: pd.DataFrame, manual_features: list = None, manual_target_column: str = None):
+def preprocess_dataset_from_mongo(df: pd.DataFrame, manual_features: list = None, manual_target_column: str = None,
+                                  source_collection: str = None, fast: bool = False, compare_exact: bool = False):
     # Keep only selected features if in manual mode
     if manual_features:
         df = df[manual_features + [manual_target_column]]
 
-    target_col = manual_target_column or detect_target_column(df)
+    # The memo key hashes the stored source, so a bare DataFrame is never memoized
+    save_name, lineage = None, None
+    if source_collection:
+        config = preprocessing_config(manual_target_column, manual_features, fast=fast)
+        save_name, lineage = processed_dataset_name(source_collection, config)
+        existing = get_processed_dataset(save_name, lineage["memo_key"])
+        if existing and not compare_exact:
+            return existing["_id"], existing.get("feature_selection")
+
+    profile = get_profile(source_collection) if source_collection else None
+    target_col = manual_target_column or detect_target_column(df, profile)
 
-    X, y = preprocess_data(df, target_col)
-    save_name = save_processed_data(X, y)
+    X, y, pipeline, report = preprocess_data(df, target_col, profile=profile, fast=fast, compare_exact=compare_exact)
+    with span("preprocess.save"):
+        save_name = save_processed_data(X, y, source_collection, save_name, lineage)
+    pipeline_file_id = save_preprocessing(save_name, pipeline, df.drop(columns=[target_col]).columns.tolist(), target_col)
+    register_dataset(save_name, "processed", feature_selection=report, pipeline_file_id=pipeline_file_id,
+                     status="complete")
 
-    return save_name
+    return save_name, report
 
 
 def preprocess(file_path: str, manual_target_column: str = None):
@@ -143,10 +386,11 @@ def preprocess(file_path: str, manual_target_column: str = None):
 
     target_col = manual_target_column or detect_target_column(df)
 
-    X, y = preprocess_data(df, target_col, top_n_categories=5,
-                           k=10, use_pca=True, pca_components=5)
+    X, y, pipeline, _ = preprocess_data(df, target_col, top_n_categories=5,
+                                        k=10, use_pca=True, pca_components=5)
     X_train, X_test, y_train, y_test = split_data(X, y)
 
-    collection_name = save_processed_data(X, y)
+    collection_name = save_processed_data(X, y, file_path)
+    save_preprocessing(collection_name, pipeline, df.drop(columns=[target_col]).columns.tolist(), target_col)
 
     return X_train, X_test, y_train, y_test, target_col, collection_name
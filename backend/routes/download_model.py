@@ -1,24 +1,87 @@
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from bson import ObjectId
 from gridfs import GridFS
+import re
 from database.mongo import db
+from utils.artifacts import EXTENSIONS
 
 router = APIRouter()
 fs = GridFS(db)
 
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, length: int):
+    # Only a single byte range is supported; anything else falls back to the full body
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        start, end = max(0, length - int(end)), length - 1
+    else:
+        start, end = int(start), min(int(end), length - 1) if end else length - 1
+    if start >= length or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def iter_file(file, start: int, end: int):
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file.read(min(file.chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
 @router.get("/download-model/{file_id}")
-def download_model(file_id: str):
+def download_model(file_id: str, request: Request):
     try:
         file = fs.get(ObjectId(file_id))
-        content = file.read()
-        filename = file.filename or "model.pkl"
-        if not filename.endswith(".pkl"): filename += ".pkl"
-
-        return Response(
-            content=content,
-            media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Model not found: {str(e)}")
+
+    extension = EXTENSIONS.get((file.metadata or {}).get("format"), ".pkl")
+    filename = file.filename or f"model{extension}"
+    if not filename.endswith(extension): filename += extension
+
+    # GridFS files are immutable, so the stored checksum (or the id) is a strong validator
+    checksum = (file.metadata or {}).get("sha256")
+    etag = f'"{checksum or file_id}"'
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+    if checksum:
+        headers["X-Checksum-SHA256"] = checksum
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    length = file.length
+    start, end, status_code = 0, length - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and length and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, length)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+
+    headers["Content-Length"] = str(max(0, end - start + 1))
+    return StreamingResponse(
+        iter_file(file, start, end),
+        status_code=status_code,
+        media_type="application/octet-stream",
+        headers=headers
+    )
@@ -1,21 +1,189 @@
 from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from utils.clean_nan_inf import clean_nan_inf
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from bson import ObjectId
+import io
+import json
+import pandas as pd
+from utils.clean_nan_inf import clean_nan_inf_columns
 
 from database.mongo import db
+from database.datasets import load_dataset, has_columnar, columnar_parts, pa, pq
+from database.registry import datasets_registry
+from utils.profile import get_profile
+
+if pa is not None:
+    import pyarrow.compute as pc
 
 router = APIRouter()
 
+BATCH_SIZE = 5000
+
+
+def _records_json(df: pd.DataFrame) -> str:
+    return clean_nan_inf_columns(df).to_json(orient="records", date_format="iso")
+
+
+def _iter_frames(collection_name: str, after, limit: int, columns: list):
+    # Keyset pagination on _id: each page is an indexed range scan, not a skip
+    query = {"_id": {"$gt": after}} if after else {}
+    projection = {column: 1 for column in columns} if columns else None
+    cursor = db[collection_name].find(query, projection).sort("_id", 1).batch_size(BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == BATCH_SIZE:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def _has_row_documents(collection_name: str) -> bool:
+    # Processed datasets saved with PROCESSED_ROW_DOCUMENTS=false exist only as their columnar copy
+    doc = datasets_registry.find_one({"_id": collection_name}, {"row_documents": 1})
+    return doc is None or doc.get("row_documents", True) or not has_columnar(collection_name)
+
+
+def _dataset_columns(collection_name: str):
+    profile = get_profile(collection_name)
+    if profile:
+        return [column["name"] for column in profile["columns"]]
+    parts = columnar_parts(collection_name) if pa is not None else []
+    if parts:
+        return pq.read_schema(pa.PythonFile(parts[0], mode="r")).names
+    doc = db[collection_name].find_one({}, {"_id": 0})
+    return list(doc) if doc else None
+
+
+def _iter_columnar_frames(collection_name: str, offset: int, limit: int, columns: list):
+    # Without row documents there is no _id to page on; the cursor is a row offset instead, and
+    # whole row groups before it are skipped using the Parquet metadata alone
+    remaining = limit
+    for grid_out in columnar_parts(collection_name):
+        parquet = pq.ParquetFile(pa.PythonFile(grid_out, mode="r"))
+        for group in range(parquet.num_row_groups):
+            rows = parquet.metadata.row_group(group).num_rows
+            if offset >= rows:
+                offset -= rows
+                continue
+            table = parquet.read_row_group(group, columns=columns).slice(offset)
+            offset = 0
+            if remaining is not None:
+                table = table.slice(0, remaining)
+                remaining -= table.num_rows
+            for batch in table.to_batches(max_chunksize=BATCH_SIZE):
+                yield batch.to_pandas()
+            if remaining is not None and remaining <= 0:
+                return
+
+
+def _ndjson_stream(frames):
+    for frame in frames:
+        lines = frame.drop(columns=["_id"], errors="ignore").pipe(clean_nan_inf_columns).to_json(
+            orient="records", lines=True, date_format="iso")
+        yield lines if lines.endswith("\n") else lines + "\n"
+
+
+def _clean_batch(batch):
+    # Arrow counterpart of clean_nan_inf_columns: +/-inf becomes null, column by column
+    arrays = []
+    for array in batch.columns:
+        if pa.types.is_floating(array.type):
+            array = pc.if_else(pc.is_inf(array), pa.scalar(None, array.type), array)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=batch.schema)
+
+
+def _iter_parquet_batches(collection_name: str, columns: list):
+    # Appended parts share the first part's schema, so they stream as one
+    for grid_out in columnar_parts(collection_name):
+        # GridOut is seekable, so only the footer and the requested row groups are fetched
+        parquet = pq.ParquetFile(pa.PythonFile(grid_out, mode="r"))
+        yield from parquet.iter_batches(batch_size=BATCH_SIZE, columns=columns)
+
+
+def _arrow_stream(collection_name: str, columns: list, limit: int):
+    sink = io.BytesIO()
+    writer = None
+    remaining = limit
+    for batch in _iter_parquet_batches(collection_name, columns):
+        if remaining is not None:
+            if remaining <= 0:
+                break
+            batch = batch.slice(0, remaining)
+            remaining -= batch.num_rows
+        batch = _clean_batch(batch)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+
 
 @router.get("/dataset/{collection_name}")
-def get_dataset(collection_name: str):
+def get_dataset(collection_name: str, limit: int = None, cursor: str = None, columns: str = None,
+                format: str = "json"):
+    column_list = [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+    if limit is not None and limit <= 0:
+        return JSONResponse(content={"error": "limit must be positive"}, status_code=400)
+    if column_list:
+        known = _dataset_columns(collection_name)
+        missing = [column for column in column_list if known is not None and column not in known]
+        if missing:
+            return JSONResponse(content={"error": f"Unknown columns: {', '.join(missing)}"}, status_code=400)
+    row_documents = _has_row_documents(collection_name)
+    if cursor and not (ObjectId.is_valid(cursor) if row_documents else cursor.isdigit()):
+        return JSONResponse(content={"error": "Invalid cursor"}, status_code=400)
+    if row_documents:
+        after = ObjectId(cursor) if cursor else None
+    else:
+        after = int(cursor) if cursor else None
+
+    def frames():
+        if row_documents:
+            return _iter_frames(collection_name, after, limit, column_list)
+        return _iter_columnar_frames(collection_name, after or 0, limit, column_list)
+
     try:
-        collection = db[collection_name]
-        dataset = list(collection.find({}, {"_id": 0}))
-        if not dataset:
+        if format == "ndjson":
+            return StreamingResponse(_ndjson_stream(frames()), media_type="application/x-ndjson")
+
+        if format == "arrow":
+            if pa is None or not has_columnar(collection_name):
+                return JSONResponse(content={"error": "Arrow output needs the columnar copy of this dataset"},
+                                    status_code=400)
+            if cursor:
+                return JSONResponse(content={"error": "Arrow output does not support cursors; use limit"},
+                                    status_code=400)
+            return StreamingResponse(_arrow_stream(collection_name, column_list, limit),
+                                     media_type="application/vnd.apache.arrow.stream")
+
+        if format != "json":
+            return JSONResponse(content={"error": f"Unsupported format '{format}'"}, status_code=400)
+
+        if limit is None and after is None:
+            # Whole dataset: served from the dataset cache / columnar copy
+            df = load_dataset(collection_name, column_list)
+            next_cursor = None
+        else:
+            page = list(frames())
+            df = pd.concat(page, ignore_index=True) if page else pd.DataFrame()
+            next_cursor = None
+            if limit and len(df) == limit:
+                next_cursor = str(df["_id"].iloc[-1]) if row_documents else str((after or 0) + len(df))
+            df = df.drop(columns=["_id"], errors="ignore")
+
+        if df.empty and after is None:
             return JSONResponse(content={"error": "No dataset found"}, status_code=404)
     except Exception as e:
         return JSONResponse(content={"error": f"Failed to fetch dataset: {e}"}, status_code=500)
 
-    cleaned_dataset = clean_nan_inf(dataset)
-    return {"dataset": cleaned_dataset}
\ No newline at end of file
+    body = '{"dataset":' + _records_json(df) + ',"next_cursor":' + json.dumps(next_cursor) + '}'
+    return Response(content=body, media_type="application/json")
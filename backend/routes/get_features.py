@@ -1,12 +1,23 @@
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 from database.mongo import db
+from utils.profile import get_profile
 
 router = APIRouter()
 
+# Plain def: FastAPI runs it on the threadpool, so the pymongo calls never block the event loop
 @router.get("/get-features/{collection_name}")
-async def get_features(collection_name: str):
+def get_features(collection_name: str):
     try:
+        # The ingest-time profile covers every column, even ones missing from the first document
+        profile = get_profile(collection_name)
+        if profile:
+            return {
+                "features": [column["name"] for column in profile["columns"]],
+                "dtypes": {column["name"]: column["dtype"] for column in profile["columns"]},
+                "row_count": profile["row_count"],
+            }
+
         collection = db[collection_name]
         dataset = collection.find_one()
 
@@ -20,3 +31,12 @@ async def get_features(collection_name: str):
         return {"features": features}
     except Exception as e:
         return JSONResponse(content={"error": f"Failed to fetch features: {str(e)}"}, status_code=500)
+
+
+@router.get("/dataset-profile/{collection_name}")
+def get_dataset_profile(collection_name: str):
+    profile = get_profile(collection_name)
+    if not profile:
+        return JSONResponse(content={"error": "No profile found for this dataset"}, status_code=404)
+    profile["collection_name"] = profile.pop("_id")
+    return profile
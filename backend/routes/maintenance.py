@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+
+from utils.cleanup import collect_garbage, MODEL_RETENTION_PER_DATASET, LOCAL_CACHE_MAX_AGE_DAYS
+
+router = APIRouter()
+
+
+@router.post("/maintenance/gc")
+def run_garbage_collection(dry_run: bool = True, keep_models: int = MODEL_RETENTION_PER_DATASET,
+                           max_cache_age_days: float = LOCAL_CACHE_MAX_AGE_DAYS):
+    # Dry run by default: report what would go, delete nothing
+    return collect_garbage(dry_run, keep_models, max_cache_age_days)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from utils.instrumentation import registry
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    # Prometheus text exposition format; counters are per worker process
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
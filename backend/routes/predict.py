@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from io import BytesIO
+import json
+import pandas as pd
+
+from utils.clean_nan_inf import clean_nan_inf
+from utils.pipelines import load_pipeline
+
+router = APIRouter()
+
+
+def _score(pipeline, record, df: pd.DataFrame, proba: bool):
+    # Missing input columns become NaN and are filled by the fitted imputers
+    X = df.reindex(columns=record["input_columns"])
+    response = {"count": len(X), "predictions": pipeline.predict(X).tolist()}
+    if proba and hasattr(pipeline, "predict_proba"):
+        try:
+            response["probabilities"] = pipeline.predict_proba(X).tolist()
+        except AttributeError:
+            pass
+    return clean_nan_inf(response)
+
+
+def _parse(body: bytes, content_type: str) -> pd.DataFrame:
+    if "text/csv" in content_type:
+        return pd.read_csv(BytesIO(body))
+    payload = json.loads(body)
+    records = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON list of records or {\"records\": [...]}")
+    return pd.DataFrame.from_records(records)
+
+
+@router.post("/predict/{file_id}")
+async def predict(file_id: str, request: Request, proba: bool = False):
+    content_type = request.headers.get("content-type", "")
+    body = await request.body()
+    try:
+        # Parsing a large batch is CPU-bound, so it stays off the event loop
+        df = await run_in_threadpool(_parse, body, content_type)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse records: {str(e)}")
+
+    if df.empty:
+        raise HTTPException(status_code=400, detail="No records to score.")
+
+    loaded = await run_in_threadpool(load_pipeline, file_id)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="No pipeline found for this model.")
+    pipeline, record = loaded
+
+    try:
+        response = await run_in_threadpool(_score, pipeline, record, df, proba)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Prediction failed: {str(e)}")
+
+    return {"file_id": file_id, "target_column": record["target_column"], **response}
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, HTTPException
+from bson import ObjectId
+
+from database.registry import list_models, best_model, list_datasets
+
+router = APIRouter()
+
+
+def _serialize(doc: dict):
+    doc = {key: str(value) if isinstance(value, ObjectId) else value for key, value in doc.items()}
+    doc["id"] = doc.pop("_id")
+    return doc
+
+
+@router.get("/models")
+def get_models(dataset: str = None, model_type: str = None, sort_by: str = "created_at",
+               page: int = 1, page_size: int = 20):
+    try:
+        result = list_models(dataset, model_type, sort_by, page, page_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "items": [_serialize(doc) for doc in result["items"]]}
+
+
+@router.get("/models/best")
+def get_best_model(dataset: str, metric: str = "accuracy", model_type: str = None):
+    try:
+        doc = best_model(dataset, metric, model_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"No model with '{metric}' found for dataset '{dataset}'.")
+    return _serialize(doc)
+
+
+@router.get("/datasets")
+def get_datasets(kind: str = None, page: int = 1, page_size: int = 20):
+    result = list_datasets(kind, page, page_size)
+    return {**result, "items": [_serialize(doc) for doc in result["items"]]}
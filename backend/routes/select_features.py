@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from database.mongo import db
-from preprocessing.preprocessor import preprocess_dataset_from_mongo
+from database.datasets import load_dataset
+from preprocessing.preprocessor import (
+    preprocess_dataset_from_mongo, preprocessing_config, processed_dataset_name, get_processed_dataset
+)
 
 router = APIRouter()
 
@@ -11,34 +13,46 @@ class FeatureSelectionRequest(BaseModel):
     mode: str  # "manual" or "auto"
     target_column: str = None
     selected_features: list[str] = None
+    fast_mode: bool = False  # Sampled, pre-screened mutual information and randomized PCA
+    compare_exact: bool = False  # Also run the exact selection and report the overlap
 
 
+# Plain def: loading and preprocessing run on the threadpool, off the event loop
 @router.post("/selected-features/{collection_name}")
-async def select_features(collection_name: str, request: FeatureSelectionRequest):
+def select_features(collection_name: str, request: FeatureSelectionRequest):
     try:
         # Validate input
         if request.mode not in ["manual", "auto"]:
             raise HTTPException(status_code=400, detail="Invalid mode")
 
+        manual = request.mode == "manual"
+
+        # Same source and config as an earlier run: return that output without loading anything
+        config = preprocessing_config(request.target_column if manual else None,
+                                      request.selected_features if manual else None, fast=request.fast_mode)
+        processed_name, lineage = processed_dataset_name(collection_name, config)
+        existing = get_processed_dataset(processed_name, lineage["memo_key"])
+        if existing and not request.compare_exact:
+            return {"message": "Preprocessing complete", "processed_collection": existing["_id"],
+                    "feature_selection": existing.get("feature_selection"), "cached": True}
+
         # Fetch dataset
-        raw_docs = list(db[collection_name].find())
-        if not raw_docs:
+        df = load_dataset(collection_name)
+        if df.empty:
             raise HTTPException(status_code=404, detail="No data found in the collection")
 
-        # Convert to DataFrame
-        import pandas as pd
-        df = pd.DataFrame(raw_docs)
-        if "_id" in df.columns:
-            df.drop(columns=["_id"], inplace=True)
-
         # Apply preprocessor
-        collection_name = preprocess_dataset_from_mongo(
+        collection_name, report = preprocess_dataset_from_mongo(
             df=df,
-            manual_features=request.selected_features if request.mode == "manual" else None,
-            manual_target_column=request.target_column if request.mode == "manual" else None
+            manual_features=request.selected_features if manual else None,
+            manual_target_column=request.target_column if manual else None,
+            source_collection=collection_name,
+            fast=request.fast_mode,
+            compare_exact=request.compare_exact
         )
 
-        return {"message": "Preprocessing complete", "processed_collection": collection_name}
+        return {"message": "Preprocessing complete", "processed_collection": collection_name,
+                "feature_selection": report}
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
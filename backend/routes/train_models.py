@@ -1,14 +1,14 @@
+from typing import Optional
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import pandas as pd
 import traceback
 
-from database.mongo import db
-from models.linear_regression import train_linear_regression
-from models.random_forest import train_random_forest
-from models.k_means import train_kmeans
-from models.svm import train_svm
-from models.all import select_best_model  # Auto-selection logic
+from database.registry import dataset_exists
+from models.train import run_training, training_config
+from utils.memo import memo_key, get_memoized_training
+from utils.jobs import submit_job, get_job, list_jobs, cancel_job, wait_for_job, serialize_job
 
 router = APIRouter()
 
@@ -17,6 +17,15 @@ class TrainRequest(BaseModel):
     collection_name: str
     model_type: str
     auto_model_selection: bool
+    wait: bool = False  # Block until the job finishes and return its result inline
+    incremental: bool = False  # Stream fixed-size batches through a partial_fit estimator
+    batch_size: Optional[int] = None
+    calibrate: bool = False  # SVM only: calibrate so the model can return probabilities
+    n_clusters: Optional[int] = None  # k_means only: omit to search for k
+    cross_validation: bool = False  # Score on out-of-fold predictions over a shared fold plan
+    tune: bool = False  # Successive-halving hyperparameter search before the final fit
+    tuning_budget: Optional[float] = None  # Seconds; defaults to TUNING_TIME_BUDGET
+    force: bool = False  # Retrain even if this dataset and config already produced a model
 
 
 @router.post("/train-model")
@@ -26,65 +35,76 @@ async def train_model(request: TrainRequest):
         if not isinstance(request.collection_name, str) or not request.collection_name.strip():
             raise HTTPException(status_code=400, detail="Invalid collection_name. Must be a non-empty string.")
 
-        collections = db.list_collection_names()
-        if request.collection_name not in collections:
+        if request.batch_size is not None and request.batch_size < 1:
+            raise HTTPException(status_code=400, detail="batch_size must be a positive integer.")
+
+        # pymongo is blocking; keep it off the event loop that also serves the waiters
+        if not await run_in_threadpool(dataset_exists, request.collection_name):
             raise HTTPException(status_code=404, detail="Specified collection not found.")
 
-        data = list(db[request.collection_name].find({}, {"_id": 0}))
-        if not data:
-            raise HTTPException(status_code=404, detail="No data found in the specified collection.")
-
-        df = pd.DataFrame(data)
-        if df.empty:
-            raise HTTPException(status_code=400, detail="Dataset is empty.")
-
-        # Detect target column
-        target = detect_target_column(df)
-
-        # Train model
-        if request.auto_model_selection:
-            result = select_best_model(
-                request.collection_name,
-                test_size=0.2,
-            )
-            model_name = result["best_model"]
-        else:
-            model_name = request.model_type
-            if model_name == "random_forest":
-                result = train_random_forest(request.collection_name, target)
-            elif model_name == "svm":
-                result = train_svm(request.collection_name)
-            elif model_name == "linear_regression":
-                result = train_linear_regression(request.collection_name)
-            elif model_name == "k_means":
-                result = train_kmeans(request.collection_name)
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported model type.")
-
-        return {
-            "message": "Model trained and saved successfully.",
-            "model_type": model_name,
-            "file_id": str(result.get("file_id")),
-            "filename": result.get("filename"),
-            "metrics": {
-                "rmse": result.get("rmse"),
-                "mae": result.get("mae"),
-                "r2": result.get("r2"),
-                "accuracy": result.get("accuracy")
-            }
+        options = {
+            "incremental": request.incremental,
+            "batch_size": request.batch_size,
+            "calibrate": request.calibrate,
+            "n_clusters": request.n_clusters,
+            "cross_validation": request.cross_validation,
+            "tune_models": request.tune,
+            "tuning_budget": request.tuning_budget,
         }
-
+        key = await run_in_threadpool(memo_key, request.collection_name,
+                                      training_config(request.model_type, request.auto_model_selection, **options))
+
+        # Same data, config and code as an earlier run: return its model instead of retraining
+        memoized = None if request.force else await run_in_threadpool(get_memoized_training, key)
+        if memoized:
+            if request.wait:
+                return {**memoized, "job_id": None, "timings": None, "memoized": True}
+            # Shaped like a finished job, so pollers stop straight away
+            return {"message": "Model already trained.", "job_id": None, "status": "succeeded", "progress": 1.0,
+                    "result": memoized, "memoized": True}
+
+        # Fitting happens in the worker pool so this event loop stays free
+        job_id = await run_in_threadpool(submit_job, "train_model", run_training, {
+            "collection_name": request.collection_name,
+            "model_type": request.model_type,
+            "auto_model_selection": request.auto_model_selection,
+            **options,
+            "memo_key": key,
+        })
+
+        if not request.wait:
+            # Only a queued job is merely accepted; memoized and waited-for results are final
+            return JSONResponse({"message": "Training job queued.", "job_id": job_id, "status": "queued"},
+                                status_code=202)
+
+        job = await wait_for_job(job_id)
+        if job["status"] != "succeeded":
+            raise HTTPException(status_code=500, detail=f"Training failed: {job.get('error') or job['status']}")
+        return {**job["result"], "job_id": job_id, "timings": job.get("timings")}
+
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Training failed: {str(e)}")
 
 
-def detect_target_column(df: pd.DataFrame):
-    if df.empty:
-        raise ValueError("Dataframe is empty. Cannot detect target column.")
+@router.get("/train-model/jobs")
+def get_training_jobs(status: str = None, limit: int = 50):
+    return {"jobs": [serialize_job(job) for job in list_jobs(status, min(limit, 500))]}
+
+
+@router.get("/train-model/jobs/{job_id}")
+def get_training_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return serialize_job(job)
+
 
-    unique_counts = df.nunique().sort_values()
-    for col, count in unique_counts.items():
-        if 1 < count < len(df):
-            return col
-    raise ValueError("No suitable target column found.")
+@router.post("/train-model/jobs/{job_id}/cancel")
+def cancel_training_job(job_id: str):
+    job = cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return serialize_job(job)
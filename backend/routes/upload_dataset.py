@@ -1,44 +1,192 @@
 from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import JSONResponse
-from io import BytesIO
+from fastapi.responses import JSONResponse, StreamingResponse
 from datetime import datetime
-import pandas as pd
+import json
+from pymongo.errors import PyMongoError
 
 from database.mongo import db
+from database.registry import register_dataset, claim_dataset, touch_claim, dataset_exists, datasets_registry
+from utils.append import DatasetAppend, acquire_append_lock, release_append_lock
+from utils.cleanup import discard_dataset
+from utils.ingest import ingest_chunks
+from utils.memo import file_hash, find_raw_dataset
+from utils.profile import get_profile
 
 router = APIRouter()
 
 
 @router.post("/upload")
-async def upload_dataset(file: UploadFile = File(...)):
-    content = await file.read()
-    file_obj = BytesIO(content)
-
-    try:
-        if file.filename.lower().endswith(".csv"):
-            df = pd.read_csv(file_obj)
-        elif file.filename.lower().endswith((".xls", ".xlsx")):
-            df = pd.read_excel(file_obj)
-        else:
-            return JSONResponse({"error": "Unsupported file format"}, status_code=400)
-    except Exception as e:
-        return JSONResponse({"error": f"Failed to parse file: {str(e)}"}, status_code=400)
+def upload_dataset(file: UploadFile = File(...), progress: bool = False):
+    if not file.filename.lower().endswith((".csv", ".xls", ".xlsx")):
+        return JSONResponse({"error": "Unsupported file format"}, status_code=400)
 
     uploaded_filename = file.filename
-    timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
 
-    raw_collection_name = f"dataset_{timestamp}"
+    # Same bytes as an earlier upload: hand back that dataset instead of ingesting a copy
+    content_hash = file_hash(file.file)
+    existing = _uploaded(content_hash)
+    if existing:
+        return _duplicate(existing, uploaded_filename, progress)
+
+    timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
+    # The hash prefix also keeps two uploads in the same second from sharing a collection
+    raw_collection_name = f"dataset_{timestamp}_{content_hash[:8]}"
     raw_collection = db[raw_collection_name]
 
-    try:
-        records = df.to_dict(orient="records")
-        inserted = raw_collection.insert_many(records)
-    except Exception as e:
-        return JSONResponse({"error": f"Failed to upload dataset: {str(e)}"}, status_code=500)
-
-    return {
-        "message": "Dataset uploaded successfully",
-        "raw_collection": raw_collection_name,
-        "file_name": uploaded_filename,
-        "row_count": len(inserted.inserted_ids)
+    # Claim the hash before ingesting, so concurrent uploads of the same bytes ingest it only once
+    if not claim_dataset(raw_collection_name, "raw", content_hash, file_name=uploaded_filename):
+        return JSONResponse({"error": "The same file is already being uploaded"}, status_code=409)
+    # An identical upload may have finished between the lookup and the claim
+    existing = _uploaded(content_hash)
+    if existing:
+        discard_dataset(raw_collection_name)
+        return _duplicate(existing, uploaded_filename, progress)
+
+    # The upload is already spooled to disk by Starlette; read it back in chunks
+    events = ingest_chunks(file.file, uploaded_filename, raw_collection,
+                           on_chunk=lambda chunk: touch_claim(raw_collection_name))
+
+    def summary(row_count):
+        register_dataset(raw_collection_name, "raw", file_name=uploaded_filename, row_count=row_count,
+                         content_hash=content_hash, status="complete")
+        return {
+            "message": "Dataset uploaded successfully",
+            "raw_collection": raw_collection_name,
+            "file_name": uploaded_filename,
+            "row_count": row_count
+        }
+
+    # A failed upload never completes its registration, so nothing else would clean up what it stored
+    return _respond(events, summary, progress, raw_collection_name,
+                    on_error=lambda: discard_dataset(raw_collection_name))
+
+
+def _uploaded(content_hash: str):
+    existing = find_raw_dataset(content_hash)
+    if existing and db.list_collection_names(filter={"name": existing["_id"]}):
+        return existing
+    return None
+
+
+def _duplicate(existing: dict, file_name: str, progress: bool):
+    duplicate = {
+        "message": "Dataset already uploaded",
+        "raw_collection": existing["_id"],
+        "file_name": file_name,
+        "row_count": existing.get("row_count"),
+        "deduplicated": True
     }
+    if progress:
+        return StreamingResponse(iter([json.dumps(duplicate) + "\n"]), media_type="application/x-ndjson")
+    return duplicate
+
+
+def _respond(events, summary, progress: bool, collection_name: str, on_error=None, on_done=None):
+    """Drive the ingest generator: NDJSON progress lines when asked for, else one JSON summary.
+
+    `summary` runs inside the same guard as the ingest, so `on_error` also covers its failures;
+    `on_done` runs once either way, even when a streaming client goes away.
+    """
+    def fail():
+        if on_error:
+            on_error()
+
+    if progress:
+        # Stream one NDJSON line per chunk, followed by the usual summary
+        def progress_stream():
+            row_count = 0
+            try:
+                for event in events:
+                    row_count = event["row_count"]
+                    yield json.dumps(event) + "\n"
+                result = summary(row_count)
+            except GeneratorExit:
+                # Client went away mid-stream; the work is abandoned, so undo it
+                fail()
+                raise
+            except Exception as e:
+                fail()
+                yield json.dumps({"error": f"Failed to upload dataset: {str(e)}", "row_count": row_count}) + "\n"
+                return
+            finally:
+                if on_done:
+                    on_done()
+            yield json.dumps(result) + "\n"
+
+        return StreamingResponse(progress_stream(), media_type="application/x-ndjson")
+
+    row_count = 0
+    try:
+        try:
+            for event in events:
+                row_count = event["row_count"]
+                print(f"Uploaded {row_count} rows to '{collection_name}' ({event['bytes_read']}/{event['total_bytes']} bytes)")
+        except PyMongoError as e:
+            fail()
+            return JSONResponse({"error": f"Failed to upload dataset: {str(e)}"}, status_code=500)
+        except Exception as e:
+            fail()
+            return JSONResponse({"error": f"Failed to parse file: {str(e)}"}, status_code=400)
+
+        try:
+            return summary(row_count)
+        except Exception as e:
+            fail()
+            return JSONResponse({"error": f"Failed to upload dataset: {str(e)}"}, status_code=500)
+    finally:
+        if on_done:
+            on_done()
+
+
+def _dataset_columns(collection_name: str):
+    profile = get_profile(collection_name)
+    if profile:
+        return [column["name"] for column in profile["columns"]]
+    doc = db[collection_name].find_one({}, {"_id": 0})
+    return list(doc) if doc else None
+
+
+@router.post("/append/{collection_name}")
+def append_dataset(collection_name: str, file: UploadFile = File(...), progress: bool = False):
+    if not file.filename.lower().endswith((".csv", ".xls", ".xlsx")):
+        return JSONResponse({"error": "Unsupported file format"}, status_code=400)
+
+    dataset = datasets_registry.find_one({"_id": collection_name})
+    if dataset is None and not dataset_exists(collection_name):
+        return JSONResponse({"error": "Dataset not found"}, status_code=404)
+    if dataset is not None and dataset.get("kind") != "raw":
+        # Processed datasets grow through their source, so they stay consistent with its pipeline
+        return JSONResponse({"error": "Rows can only be appended to uploaded datasets"}, status_code=400)
+    if dataset is not None and dataset.get("status") == "ingesting":
+        return JSONResponse({"error": "Dataset is still being uploaded"}, status_code=409)
+
+    if dataset is None:
+        # Pre-registry upload: register it so it can carry the append lock and row count
+        register_dataset(collection_name, "raw", row_count=db[collection_name].estimated_document_count())
+    if not acquire_append_lock(collection_name):
+        return JSONResponse({"error": "Another append to this dataset is in progress"}, status_code=409)
+
+    try:
+        appended_hash = file_hash(file.file)
+        # Loads the fitted pipelines and models up front; only the new rows pass through them
+        appender = DatasetAppend(collection_name)
+        events = ingest_chunks(file.file, file.filename, db[collection_name], append=True,
+                               columns=_dataset_columns(collection_name), on_chunk=appender.update)
+    except Exception:
+        release_append_lock(collection_name)
+        raise
+
+    def summary(row_count):
+        derived = appender.finish(row_count, appended_hash)
+        total = datasets_registry.find_one({"_id": collection_name}, {"row_count": 1})["row_count"]
+        return {
+            "message": "Rows appended successfully",
+            "raw_collection": collection_name,
+            "file_name": file.filename,
+            "appended_rows": row_count,
+            "row_count": total,
+            **derived
+        }
+
+    return _respond(events, summary, progress, collection_name, on_error=appender.abort,
+                    on_done=lambda: release_append_lock(collection_name))
@@ -0,0 +1,189 @@
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+from bson import ObjectId
+
+from database.mongo import db
+from database.datasets import ColumnarWriter, columnar_fs, columnar_parts, has_columnar, mark_dataset_written
+from database.registry import datasets_registry, models_registry
+from models.incremental import IncrementalUpdate
+from utils.artifacts import load_artifact
+from utils.cleanup import delete_model
+from utils.ingest import insert_in_batches
+from utils.instrumentation import span
+from utils.memo import chain_hash, dataset_hash
+from utils.pipelines import PIPELINE_BUCKET, get_preprocessing, pipeline_collection, save_full_pipeline
+from utils.profile import get_profiler, save_profile, profiles_collection
+
+# An append lock older than this is taken to belong to a process that died mid-append
+APPEND_LOCK_SECONDS = int(os.getenv("APPEND_LOCK_SECONDS", "3600"))
+
+
+def acquire_append_lock(collection_name: str) -> bool:
+    """Claim the dataset for one append at a time; False if another append holds it."""
+    now = datetime.now()
+    claimed = datasets_registry.find_one_and_update(
+        {"_id": collection_name, "$or": [
+            {"appending_since": None},
+            {"appending_since": {"$lt": now - timedelta(seconds=APPEND_LOCK_SECONDS)}},
+        ]},
+        {"$set": {"appending_since": now}},
+    )
+    return claimed is not None
+
+
+def release_append_lock(collection_name: str):
+    datasets_registry.update_one({"_id": collection_name}, {"$set": {"appending_since": None}})
+
+
+class _Snapshot:
+    """What a dataset looked like before the append, so a failure can put it back."""
+
+    def __init__(self, collection_name: str):
+        self.name = collection_name
+        doc = db[collection_name].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        self.last_id = doc["_id"] if doc else None
+        self.parts = {grid_out._id for grid_out in columnar_parts(collection_name)}
+        self.profile = profiles_collection.find_one({"_id": collection_name})
+
+    def restore(self):
+        # Appends are serialized per dataset, so every newer row document is ours
+        db[self.name].delete_many({"_id": {"$gt": self.last_id}} if self.last_id is not None else {})
+        for grid_out in columnar_parts(self.name):
+            if grid_out._id not in self.parts:
+                columnar_fs.delete(grid_out._id)
+        if self.profile is not None:
+            profiles_collection.replace_one({"_id": self.name}, self.profile, upsert=True)
+        else:
+            profiles_collection.delete_one({"_id": self.name})
+        mark_dataset_written(self.name)
+
+
+def _commit_rows(collection_name: str, rows: int, appended_hash: str):
+    datasets_registry.update_one({"_id": collection_name}, {
+        "$inc": {"row_count": rows},
+        "$set": {"content_hash": chain_hash(dataset_hash(collection_name), appended_hash),
+                 "updated_at": datetime.now()},
+    })
+
+
+class _ProcessedTarget:
+    """One processed dataset derived from the source, extended with transform-only output."""
+
+    def __init__(self, doc: dict, preprocessing: dict):
+        self.name = doc["_id"]
+        self.snapshot = _Snapshot(self.name)
+        self.preprocessing = preprocessing
+        self.target = preprocessing["target_column"]
+        self.feature_columns = [column for column in doc["columns"] if column != self.target]
+        self.row_documents = doc.get("row_documents", True)
+        self.columnar = ColumnarWriter(self.name, append=True) if has_columnar(self.name) else None
+        self.profiler = get_profiler(self.name)
+        self.rows = 0
+
+    def write(self, features, chunk: pd.DataFrame):
+        df = pd.DataFrame(features, columns=self.feature_columns)
+        df[self.target] = chunk[self.target].to_numpy()
+        if self.row_documents:
+            insert_in_batches(db[self.name], df)
+        if self.columnar:
+            self.columnar.write(df)
+        if self.profiler:
+            self.profiler.update(df)
+        self.rows += len(df)
+
+    def close(self):
+        if self.columnar:
+            self.columnar.close()
+        if self.profiler:
+            save_profile(self.name, self.profiler)
+        mark_dataset_written(self.name)
+
+
+class DatasetAppend:
+    """Carries rows appended to a raw dataset through everything built from it, without refitting.
+
+    Every processed dataset derived from the source gets the new rows run through its already fitted
+    preprocessing pipeline (transform only), and the latest partial_fit model of each type trained on
+    the source or those datasets continues learning from them. Work scales with the appended rows.
+    Registry row counts and content hashes change last, once everything else is stored; until then
+    `abort` restores every touched dataset. Hold the source's append lock around the whole append.
+    """
+
+    def __init__(self, source_collection: str):
+        self.source = source_collection
+        self.snapshot = _Snapshot(source_collection)
+        self.transforms = {}
+        self.processed = []
+        self.saved_models = []
+        for doc in datasets_registry.find({"kind": "processed", "source": source_collection, "status": "complete"}):
+            preprocessing = get_preprocessing(doc["_id"])
+            if preprocessing is not None and doc.get("columns"):
+                self.processed.append(_ProcessedTarget(doc, preprocessing))
+                self.transforms[doc["_id"]] = preprocessing
+
+        self.models = []
+        datasets = [source_collection] + [target.name for target in self.processed]
+        latest = set()
+        for doc in models_registry.find({"dataset": {"$in": datasets}, "metrics.training_mode": "incremental"},
+                                        sort=[("created_at", -1)]):
+            if (doc["dataset"], doc["model_type"]) in latest:
+                continue
+            # The pipeline bundled at training time names the preprocessing the model's inputs went through
+            bundled = pipeline_collection.find_one({"model_file_id": str(doc["_id"])})
+            preprocessing = get_preprocessing(bundled["processed_collection"]) if bundled else None
+            if preprocessing is None:
+                continue
+            latest.add((doc["dataset"], doc["model_type"]))
+            self.transforms[preprocessing["_id"]] = preprocessing
+            self.models.append((IncrementalUpdate(doc), preprocessing))
+
+        self.pipelines = {name: load_artifact(record["file_id"], PIPELINE_BUCKET)
+                          for name, record in self.transforms.items()}
+
+    def update(self, chunk: pd.DataFrame):
+        # Each fitted pipeline transforms the chunk once, shared by its dataset and its models
+        features = {}
+        with span("append.transform"):
+            for name, record in self.transforms.items():
+                features[name] = self.pipelines[name].transform(chunk.reindex(columns=record["input_columns"]))
+        for target in self.processed:
+            target.write(features[target.name], chunk)
+        for updater, preprocessing in self.models:
+            X = features[preprocessing["_id"]]
+            names = getattr(updater.model, "feature_names_in_", None)
+            if names is not None:
+                X = pd.DataFrame(X, columns=list(names))
+            y = chunk[preprocessing["target_column"]] if updater.model_type != "k_means" else None
+            updater.update(X, y)
+
+    def abort(self):
+        for target in self.processed:
+            if target.columnar:
+                target.columnar.abort()
+            target.snapshot.restore()
+        self.snapshot.restore()
+        for file_id in self.saved_models:
+            delete_model(ObjectId(file_id))
+
+    def finish(self, row_count: int, appended_hash: str) -> dict:
+        for target in self.processed:
+            target.close()
+
+        models = []
+        for updater, preprocessing in self.models:
+            if not updater.rows:
+                continue
+            saved = updater.save()
+            self.saved_models.append(saved["file_id"])
+            saved["pipeline_file_id"] = save_full_pipeline(saved["file_id"], preprocessing)
+            models.append(saved)
+
+        # Commit point: only now do the registry counts and content hashes move
+        for target in self.processed:
+            _commit_rows(target.name, target.rows, appended_hash)
+        _commit_rows(self.source, row_count, appended_hash)
+        return {
+            "processed": [{"processed_collection": target.name, "rows": target.rows} for target in self.processed],
+            "models": models,
+        }
@@ -0,0 +1,129 @@
+import io
+import os
+import pickle
+import struct
+import tempfile
+import time
+import zlib
+import hashlib
+import joblib
+from datetime import datetime
+from bson import ObjectId
+from gridfs import GridFS
+
+from database.mongo import db
+from utils.instrumentation import span
+
+ARTIFACT_FORMAT = os.getenv("MODEL_ARTIFACT_FORMAT", "pickle")
+ARTIFACT_COMPRESSION = int(os.getenv("MODEL_ARTIFACT_COMPRESSION", "3"))
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "mlstudio-artifacts"))
+
+# pickle:  plain pickle.dump, readable by any client
+# pickle5: protocol 5 with numpy buffers stored out-of-band, each frame zlib-compressed
+# joblib:  joblib.dump with zlib compression
+# mmap:    uncompressed joblib, loaded memory-mapped from the local artifact cache so
+#          workers on one host share the array pages
+FORMATS = ("pickle", "pickle5", "joblib", "mmap")
+EXTENSIONS = {"pickle": ".pkl", "pickle5": ".pkl5z", "joblib": ".joblib", "mmap": ".joblib"}
+
+PICKLE5_MAGIC = b"MLSP5\x00"
+
+
+def _frame(data) -> bytes:
+    compressed = zlib.compress(data, ARTIFACT_COMPRESSION)
+    return struct.pack("<Q", len(compressed)) + compressed
+
+
+def _read_frame(stream) -> bytes:
+    (size,) = struct.unpack("<Q", stream.read(8))
+    return zlib.decompress(stream.read(size))
+
+
+def serialize(obj, artifact_format: str = ARTIFACT_FORMAT):
+    """Serialize `obj` into a seekable buffer; returns (buffer, metadata)."""
+    if artifact_format not in FORMATS:
+        raise ValueError(f"Unknown artifact format '{artifact_format}'. Expected one of {FORMATS}.")
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    raw_size = None
+    if artifact_format == "pickle":
+        pickle.dump(obj, buffer)
+    elif artifact_format == "pickle5":
+        buffers = []
+        main = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raw_size = len(main) + sum(memoryview(b.raw()).nbytes for b in buffers)
+        buffer.write(PICKLE5_MAGIC + struct.pack("<I", len(buffers)))
+        buffer.write(_frame(main))
+        for pickle_buffer in buffers:
+            buffer.write(_frame(pickle_buffer.raw()))
+    elif artifact_format == "joblib":
+        joblib.dump(obj, buffer, compress=("zlib", ARTIFACT_COMPRESSION))
+    else:
+        joblib.dump(obj, buffer)
+
+    stored_size = buffer.tell()
+    buffer.seek(0)
+    metadata = {
+        "format": artifact_format,
+        "sha256": hashlib.sha256(buffer.getbuffer()).hexdigest(),
+        "stored_size": stored_size,
+        "raw_size": raw_size or stored_size,
+        "serialize_time": round(time.perf_counter() - start, 4),
+    }
+    return buffer, metadata
+
+
+def put_artifact(obj, filename: str, bucket: str = "fs", metadata: dict = None, artifact_format: str = ARTIFACT_FORMAT):
+    with span("artifact.serialize"):
+        buffer, stats = serialize(obj, artifact_format)
+    with span("artifact.upload"):
+        file_id = GridFS(db, collection=bucket).put(buffer, filename=filename, metadata={**(metadata or {}), **stats})
+    return file_id, stats
+
+
+def _cached_path(fs, file_id, extension: str) -> str:
+    # Download once per host; later loads map the same file
+    os.makedirs(ARTIFACT_CACHE_DIR, exist_ok=True)
+    path = os.path.join(ARTIFACT_CACHE_DIR, f"{file_id}{extension}")
+    if not os.path.exists(path):
+        grid_out = fs.get(file_id)
+        fd, tmp_path = tempfile.mkstemp(dir=ARTIFACT_CACHE_DIR)
+        with os.fdopen(fd, "wb") as tmp:
+            for chunk in grid_out:
+                tmp.write(chunk)
+        os.replace(tmp_path, path)
+    return path
+
+
+def load_artifact(file_id, bucket: str = "fs"):
+    """Load an artifact from a GridFS bucket in whatever format it was stored, recording load stats."""
+    if isinstance(file_id, str):
+        file_id = ObjectId(file_id)
+    fs = GridFS(db, collection=bucket)
+    start = time.perf_counter()
+    grid_out = fs.get(file_id)
+    artifact_format = (grid_out.metadata or {}).get("format", "pickle")
+
+    if artifact_format == "mmap":
+        obj = joblib.load(_cached_path(fs, file_id, EXTENSIONS["mmap"]), mmap_mode="r")
+    elif artifact_format == "joblib":
+        obj = joblib.load(io.BytesIO(grid_out.read()))
+    elif artifact_format == "pickle5":
+        stream = io.BytesIO(grid_out.read())
+        if stream.read(len(PICKLE5_MAGIC)) != PICKLE5_MAGIC:
+            raise ValueError(f"Artifact {file_id} is not a pickle5 artifact")
+        (buffer_count,) = struct.unpack("<I", stream.read(4))
+        main = _read_frame(stream)
+        buffers = [bytearray(_read_frame(stream)) for _ in range(buffer_count)]
+        obj = pickle.loads(main, buffers=buffers)
+    else:
+        obj = pickle.loads(grid_out.read())
+
+    load_time = round(time.perf_counter() - start, 4)
+    db[f"{bucket}.files"].update_one(
+        {"_id": file_id},
+        {"$set": {"metadata.last_load_time": load_time, "metadata.last_loaded_at": datetime.now()},
+         "$inc": {"metadata.load_count": 1}},
+    )
+    return obj
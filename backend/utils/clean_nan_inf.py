@@ -1,4 +1,6 @@
 import math
+import numpy as np
+import pandas as pd
 
 
 def clean_nan_inf(obj):
@@ -11,3 +13,16 @@ def clean_nan_inf(obj):
     elif isinstance(obj, list):
         return [clean_nan_inf(v) for v in obj]
     return obj
+
+
+def clean_nan_inf_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # Vectorized per float column: +/-inf becomes NaN, which serializers emit as null
+    float_cols = df.select_dtypes(include=["floating"]).columns
+    if len(float_cols) == 0:
+        return df
+    df = df.copy(deep=False)
+    for col in float_cols:
+        values = df[col].to_numpy()
+        if np.isinf(values).any():
+            df[col] = np.where(np.isinf(values), np.nan, values)
+    return df
@@ -0,0 +1,179 @@
+import os
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from gridfs import GridFS
+from pymongo import ASCENDING, DESCENDING
+
+from database.mongo import db
+from database.datasets import columnar_fs, delete_columnar, mark_dataset_written
+from database.registry import models_registry, datasets_registry, training_runs
+from models.cross_validation import CV_CACHE_DIR
+from utils.artifacts import ARTIFACT_CACHE_DIR
+from utils.pipelines import PIPELINE_BUCKET, preprocessing_collection, pipeline_collection
+from utils.profile import profiles_collection
+
+# Periodic collection is off unless an interval is set; POST /maintenance/gc works either way
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS", "0"))
+# Nothing younger than this is touched, so artifacts of in-flight jobs are never mistaken for orphans
+GC_GRACE_SECONDS = int(os.getenv("GC_GRACE_SECONDS", "3600"))
+# Newest models kept per (dataset, model type); 0 keeps every model
+MODEL_RETENTION_PER_DATASET = int(os.getenv("MODEL_RETENTION_PER_DATASET", "0"))
+LOCAL_CACHE_MAX_AGE_DAYS = float(os.getenv("LOCAL_CACHE_MAX_AGE_DAYS", "7"))
+
+model_fs = GridFS(db)
+pipeline_fs = GridFS(db, collection=PIPELINE_BUCKET)
+
+
+def _cutoff(utc: bool = False) -> datetime:
+    # Registry timestamps are local time; GridFS uploadDate and ObjectId times are UTC
+    return (datetime.utcnow() if utc else datetime.now()) - timedelta(seconds=GC_GRACE_SECONDS)
+
+
+def _dataset_present(name: str, collections: set) -> bool:
+    return name in collections or datasets_registry.find_one({"_id": name}, {"_id": 1}) is not None
+
+
+def discard_dataset(collection_name: str):
+    """Remove everything an unfinished upload stored: rows, columnar copy, profile and its registry claim."""
+    db[collection_name].drop()
+    delete_columnar(collection_name)
+    profiles_collection.delete_one({"_id": collection_name})
+    datasets_registry.delete_one({"_id": collection_name, "status": "ingesting"})
+    mark_dataset_written(collection_name)
+
+
+def delete_model(file_id, dry_run: bool = False):
+    if dry_run:
+        return
+    model_id = str(file_id)
+    for pipeline in pipeline_collection.find({"model_file_id": model_id}, {"_id": 1}):
+        pipeline_fs.delete(pipeline["_id"])
+        pipeline_collection.delete_one({"_id": pipeline["_id"]})
+    # Memoized runs that point at this model would otherwise hand out a dead file_id
+    training_runs.delete_many({"file_id": model_id})
+    model_fs.delete(file_id)
+    models_registry.delete_one({"_id": file_id})
+
+
+def evict_models(keep: int, dry_run: bool = False) -> list:
+    """Drop all but the newest `keep` models of each (dataset, model type), with their pipelines."""
+    if keep <= 0:
+        return []
+    cutoff = _cutoff()
+    evicted, seen = [], {}
+    cursor = models_registry.find({}, {"dataset": 1, "model_type": 1, "created_at": 1}).sort(
+        [("dataset", ASCENDING), ("model_type", ASCENDING), ("created_at", DESCENDING)])
+    for doc in cursor:
+        group = (doc.get("dataset"), doc.get("model_type"))
+        seen[group] = seen.get(group, 0) + 1
+        if seen[group] > keep and doc["created_at"] < cutoff:
+            delete_model(doc["_id"], dry_run)
+            evicted.append(str(doc["_id"]))
+    return evicted
+
+
+def orphan_models(dry_run: bool = False) -> list:
+    # Only artifacts written through put_artifact carry a sha256; older uploads are left alone
+    removed = []
+    for grid_out in model_fs.find({"metadata.sha256": {"$exists": True}, "uploadDate": {"$lt": _cutoff(utc=True)}}):
+        if models_registry.find_one({"_id": grid_out._id}, {"_id": 1}) is None:
+            delete_model(grid_out._id, dry_run)
+            removed.append(str(grid_out._id))
+    return removed
+
+
+def orphan_pipelines(collections: set, dry_run: bool = False) -> list:
+    """Preprocessing records of processed datasets that are gone, and pipeline files nothing references."""
+    removed = []
+    for record in preprocessing_collection.find({"created_at": {"$lt": _cutoff()}}):
+        if not _dataset_present(record["_id"], collections):
+            removed.append(str(record["file_id"]))
+            if not dry_run:
+                pipeline_fs.delete(record["file_id"])
+                preprocessing_collection.delete_one({"_id": record["_id"]})
+
+    referenced = {str(record["file_id"]) for record in preprocessing_collection.find({}, {"file_id": 1})}
+    referenced.update(str(record["_id"]) for record in pipeline_collection.find({}, {"_id": 1}))
+    for grid_out in pipeline_fs.find({"uploadDate": {"$lt": _cutoff(utc=True)}}):
+        if str(grid_out._id) not in referenced and str(grid_out._id) not in removed:
+            removed.append(str(grid_out._id))
+            if not dry_run:
+                pipeline_fs.delete(grid_out._id)
+    return removed
+
+
+def orphan_columnar(collections: set, dry_run: bool = False) -> list:
+    removed = []
+    for grid_out in columnar_fs.find({"uploadDate": {"$lt": _cutoff(utc=True)}}):
+        if not _dataset_present(grid_out.filename, collections):
+            removed.append(grid_out.filename)
+            if not dry_run:
+                columnar_fs.delete(grid_out._id)
+    return removed
+
+
+def _staging_time(name: str):
+    # Staging collections are suffixed with an ObjectId, which dates them even while still empty
+    suffix = name.rpartition("__staging_")[2]
+    return ObjectId(suffix).generation_time.replace(tzinfo=None) if ObjectId.is_valid(suffix) else None
+
+
+def stale_staging(collections: set, dry_run: bool = False) -> list:
+    # Left behind when a processed-data write died before its rename
+    removed = []
+    for name in sorted(collections):
+        if "__staging_" not in name:
+            continue
+        # A staging collection that cannot be dated may still be in use, so it is left alone
+        created = _staging_time(name)
+        if created is not None and created < _cutoff(utc=True):
+            removed.append(name)
+            if not dry_run:
+                db[name].drop()
+    return removed
+
+
+def stale_uploads(dry_run: bool = False) -> list:
+    # Upload claims whose process died mid-ingest; they would otherwise block the same file forever.
+    # A live ingest refreshes updated_at on every chunk, so only claims idle past the grace period go
+    removed = []
+    for doc in datasets_registry.find({"status": "ingesting", "updated_at": {"$lt": _cutoff()}}, {"_id": 1}):
+        removed.append(doc["_id"])
+        if not dry_run:
+            discard_dataset(doc["_id"])
+    return removed
+
+
+def prune_local_cache(max_age_days: float = LOCAL_CACHE_MAX_AGE_DAYS, dry_run: bool = False) -> list:
+    """Delete local artifact and fold files not used for `max_age_days`; they are re-fetched on demand."""
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for directory in (ARTIFACT_CACHE_DIR, CV_CACHE_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file() and max(entry.stat().st_atime, entry.stat().st_mtime) < cutoff:
+                removed.append(entry.path)
+                if not dry_run:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+    return removed
+
+
+def collect_garbage(dry_run: bool = False, keep_models: int = MODEL_RETENTION_PER_DATASET,
+                    max_cache_age_days: float = LOCAL_CACHE_MAX_AGE_DAYS) -> dict:
+    start = time.perf_counter()
+    collections = set(db.list_collection_names())
+    report = {
+        "evicted_models": evict_models(keep_models, dry_run),
+        "orphan_models": orphan_models(dry_run),
+        "orphan_pipelines": orphan_pipelines(collections, dry_run),
+        "orphan_columnar": orphan_columnar(collections, dry_run),
+        "staging_collections": stale_staging(collections, dry_run),
+        "stale_uploads": stale_uploads(dry_run),
+        "local_cache_files": prune_local_cache(max_cache_age_days, dry_run),
+    }
+    return {"dry_run": dry_run, **report, "elapsed": round(time.perf_counter() - start, 4)}
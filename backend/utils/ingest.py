@@ -0,0 +1,94 @@
+import os
+import pandas as pd
+
+from database.datasets import COLUMNAR_STORAGE, ColumnarWriter, mark_dataset_written, has_columnar
+from utils.profile import DatasetProfiler, save_profile, get_profiler
+
+CHUNK_ROWS = int(os.getenv("UPLOAD_CHUNK_ROWS", "50000"))
+INSERT_BATCH_SIZE = int(os.getenv("UPLOAD_INSERT_BATCH_SIZE", "5000"))
+
+
+def _file_size(file_obj):
+    position = file_obj.tell()
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(position)
+    return size
+
+
+def insert_in_batches(collection, df: pd.DataFrame, batch_size: int = INSERT_BATCH_SIZE):
+    # Convert and insert one slice at a time so only one batch of dicts is alive
+    inserted = 0
+    for start in range(0, len(df), batch_size):
+        records = df.iloc[start:start + batch_size].to_dict(orient="records")
+        if records:
+            collection.insert_many(records, ordered=False)
+            inserted += len(records)
+    return inserted
+
+
+def read_chunks(file_obj, filename: str, chunk_rows: int = CHUNK_ROWS):
+    name = filename.lower()
+    if name.endswith(".csv"):
+        yield from pd.read_csv(file_obj, chunksize=chunk_rows)
+    elif name.endswith((".xls", ".xlsx")):
+        # Excel can't be parsed incrementally, but we still insert it in batches
+        yield pd.read_excel(file_obj)
+    else:
+        raise ValueError("Unsupported file format")
+
+
+def ingest_chunks(file_obj, filename: str, collection, chunk_rows: int = CHUNK_ROWS, append: bool = False,
+                  columns: list = None, on_chunk=None):
+    """Stream a spooled upload into `collection`, yielding progress after every chunk.
+
+    With `append`, rows are added to an existing dataset: its columnar copy gets a new part and its
+    stored profile is updated rather than rebuilt. `columns` pins the expected column set, and
+    `on_chunk` is called with every chunk once it is stored.
+    """
+    total_bytes = _file_size(file_obj)
+    row_count = 0
+    if append:
+        # A dataset stored only as row documents stays that way; a lone appended part would hide them
+        columnar = ColumnarWriter(collection.name, append=True) if has_columnar(collection.name) else None
+        # Without a stored profile there is nothing to extend; readers fall back to computing it
+        profiler = get_profiler(collection.name)
+    else:
+        columnar = ColumnarWriter(collection.name) if COLUMNAR_STORAGE else None
+        profiler = DatasetProfiler()
+
+    try:
+        for chunk_index, chunk in enumerate(read_chunks(file_obj, filename, chunk_rows), start=1):
+            if columns is not None:
+                if set(chunk.columns.astype(str)) != set(columns):
+                    raise ValueError(f"Expected columns {sorted(columns)}, got {sorted(chunk.columns.astype(str))}")
+                chunk = chunk[columns]
+            row_count += insert_in_batches(collection, chunk)
+            if columnar:
+                columnar.write(chunk)
+            if profiler:
+                profiler.update(chunk)
+            if on_chunk:
+                on_chunk(chunk)
+            yield _progress(chunk_index, row_count, file_obj, total_bytes)
+    except BaseException:
+        if columnar:
+            columnar.abort()
+        raise
+
+    if columnar:
+        columnar.close()
+    if profiler:
+        save_profile(collection.name, profiler)
+    mark_dataset_written(collection.name)
+
+
+def _progress(chunk_index, row_count, file_obj, total_bytes):
+    bytes_read = min(file_obj.tell(), total_bytes) if total_bytes else 0
+    return {
+        "chunk": chunk_index,
+        "row_count": row_count,
+        "bytes_read": bytes_read,
+        "total_bytes": total_bytes,
+        "progress": round(bytes_read / total_bytes, 4) if total_bytes else None,
+    }
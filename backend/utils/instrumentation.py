@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Peak allocation tracking goes through tracemalloc, which slows allocation-heavy code; opt in
+TRACE_MEMORY = os.getenv("INSTRUMENT_MEMORY", "false").lower() in ("1", "true", "yes")
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Spans finished under the current request or job land here as well as in the process registry
+_collector = ContextVar("span_collector", default=None)
+# Open spans on this thread, innermost last, so nested peaks roll up to their parents
+_stack = ContextVar("span_stack", default=())
+
+
+class Histogram:
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Registry:
+    """Process-local metrics in Prometheus text format; no client library needed."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.span_seconds = {}
+        self.span_cpu_seconds = {}
+        self.span_peak_bytes = {}
+        self.request_seconds = {}
+
+    def observe_span(self, record: dict):
+        name = record["name"]
+        with self.lock:
+            self.span_seconds.setdefault(name, Histogram()).observe(record["wall_time"])
+            self.span_cpu_seconds[name] = self.span_cpu_seconds.get(name, 0.0) + record["cpu_time"]
+            if record.get("peak_bytes") is not None:
+                self.span_peak_bytes[name] = max(self.span_peak_bytes.get(name, 0), record["peak_bytes"])
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        with self.lock:
+            self.request_seconds.setdefault((method, route, str(status)), Histogram()).observe(seconds)
+
+    def render(self) -> str:
+        lines = []
+
+        def histogram(metric, help_text, series):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, hist in series:
+                # observe() already counts a value into every bucket it fits, so counts are cumulative
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {hist.count}')
+                lines.append(f"{metric}_sum{{{labels}}} {hist.sum}")
+                lines.append(f"{metric}_count{{{labels}}} {hist.count}")
+
+        with self.lock:
+            histogram("mlstudio_span_seconds", "Wall time of instrumented stages.",
+                      [(f'span="{name}"', hist) for name, hist in sorted(self.span_seconds.items())])
+            lines.append("# HELP mlstudio_span_cpu_seconds_total CPU time of instrumented stages.")
+            lines.append("# TYPE mlstudio_span_cpu_seconds_total counter")
+            for name, value in sorted(self.span_cpu_seconds.items()):
+                lines.append(f'mlstudio_span_cpu_seconds_total{{span="{name}"}} {value}')
+            lines.append("# HELP mlstudio_span_peak_bytes Largest peak Python allocation seen in a stage.")
+            lines.append("# TYPE mlstudio_span_peak_bytes gauge")
+            for name, value in sorted(self.span_peak_bytes.items()):
+                lines.append(f'mlstudio_span_peak_bytes{{span="{name}"}} {value}')
+            histogram("mlstudio_http_request_seconds", "HTTP request latency.",
+                      [(f'method="{m}",route="{r}",status="{s}"', hist)
+                       for (m, r, s), hist in sorted(self.request_seconds.items())])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+@contextmanager
+def span(name: str):
+    """Time a stage: wall time, this thread's CPU time and, with INSTRUMENT_MEMORY, peak traced allocation."""
+    parent = _stack.get()
+    frame = {"peak": 0}
+    if TRACE_MEMORY:
+        current, peak = tracemalloc.get_traced_memory()
+        if parent:
+            parent[-1]["peak"] = max(parent[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+        frame["start"] = current
+    token = _stack.set(parent + (frame,))
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        record = {
+            "name": name,
+            "wall_time": round(time.perf_counter() - wall_start, 6),
+            "cpu_time": round(time.thread_time() - cpu_start, 6),
+            "peak_bytes": None,
+        }
+        _stack.reset(token)
+        if TRACE_MEMORY:
+            # tracemalloc is process-wide, so concurrent requests inflate each other's peaks
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["peak_bytes"] = max(peak - frame["start"], 0)
+            if parent:
+                parent[-1]["peak"] = max(parent[-1]["peak"], peak)
+        registry.observe_span(record)
+        collected = _collector.get()
+        if collected is not None:
+            collected.append(record)
+
+
+@contextmanager
+def collect_spans():
+    """Gather every span finished inside the block, including on threadpool threads it hands work to."""
+    spans = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+
+def observe_spans(spans: list):
+    # Spans recorded in a worker process, replayed into this process's registry
+    for record in spans or []:
+        registry.observe_span(record)
+
+
+def server_timing(spans: list) -> str:
+    entries = []
+    for i, record in enumerate(spans):
+        desc = f"cpu={record['cpu_time'] * 1000:.1f}ms"
+        if record.get("peak_bytes") is not None:
+            desc += f" peak={record['peak_bytes'] / 1e6:.1f}MB"
+        entries.append(f'{record["name"].replace(".", "-")}-{i};dur={record["wall_time"] * 1000:.1f};desc="{desc}"')
+    return ", ".join(entries)
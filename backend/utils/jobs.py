@@ -0,0 +1,253 @@
+import asyncio
+import os
+import socket
+import traceback
+import uuid
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+from pymongo import ReturnDocument
+
+from database.mongo import db
+from utils.instrumentation import collect_spans, observe_spans
+
+TRAINING_WORKERS = int(os.getenv("TRAINING_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# "thread" keeps jobs in-process, e.g. when running against an in-memory Mongo stand-in
+TRAINING_EXECUTOR = os.getenv("TRAINING_EXECUTOR", "process")
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+jobs_collection = db["training_jobs"]
+_executor = None
+_executor_lock = threading.Lock()
+_futures = {}
+# The reporter of the job running in this context, so code deep inside it can reach its commit point
+_reporter = ContextVar("job_reporter", default=None)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_executor():
+    global _executor
+    # Routes submit from several threadpool threads; only one of them may create the executor
+    with _executor_lock:
+        if _executor is None:
+            if TRAINING_EXECUTOR == "thread":
+                _executor = ThreadPoolExecutor(max_workers=TRAINING_WORKERS)
+            else:
+                # Spawn so each worker opens its own Mongo client instead of inheriting a forked one
+                _executor = ProcessPoolExecutor(
+                    max_workers=TRAINING_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return _executor
+
+
+class JobReporter:
+    """Passed to the job function to record progress; raises JobCancelled once a cancel is requested.
+
+    Once the job commits (its model is stored), cancel requests no longer interrupt it.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.committed = False
+
+    def __call__(self, stage: str, progress: float):
+        job = jobs_collection.find_one_and_update(
+            {"_id": self.job_id},
+            {"$set": {"stage": stage, "progress": round(progress, 4), "updated_at": datetime.now()}},
+            projection={"cancel_requested": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        self._check(job, stage)
+
+    def commit(self, stage: str, check: bool = True):
+        if check and not self.committed:
+            self._check(jobs_collection.find_one({"_id": self.job_id}, {"cancel_requested": 1}), stage)
+        self.committed = True
+
+    def _check(self, job: dict, stage: str):
+        if job and job.get("cancel_requested") and not self.committed:
+            raise JobCancelled(f"Job {self.job_id} was cancelled during '{stage}'")
+
+
+def commit_job(stage: str, check: bool = True):
+    """Commit point of the job running here: a last cancellation check, then cancels are ignored.
+
+    Called right before results are stored, so a cancelled job never leaves a saved model behind.
+    `check=False` commits without checking, for results another process already stored.
+    """
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter.commit(stage, check)
+
+
+def _execute(job_id: str, func, kwargs: dict):
+    # Claim the job atomically so a cancelled or already-claimed job never runs twice
+    job = jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued", "cancel_requested": {"$ne": True}},
+        {"$set": {"status": "running", "started_at": datetime.now(), "worker_pid": os.getpid()}},
+    )
+    if job is None:
+        return None
+
+    reporter = JobReporter(job_id)
+    token = _reporter.set(reporter)
+    with collect_spans() as spans:
+        try:
+            result = func(**kwargs, report=reporter)
+        except JobCancelled:
+            _finish(job_id, "cancelled", timings=spans)
+            return spans
+        except Exception as e:
+            traceback.print_exc()
+            _finish(job_id, "failed", error=str(e), timings=spans)
+            return spans
+        finally:
+            _reporter.reset(token)
+
+    _finish(job_id, "succeeded", result=result, timings=spans)
+    # Handed back to the parent so spans from worker processes reach its /metrics
+    return spans
+
+
+def _finish(job_id: str, status: str, result: dict = None, error: str = None, timings: list = None):
+    update = {"status": status, "finished_at": datetime.now(), "updated_at": datetime.now(), "timings": timings}
+    if status == "succeeded":
+        update["progress"] = 1.0
+    if result is not None:
+        update["result"] = result
+    if error is not None:
+        update["error"] = error
+    jobs_collection.update_one({"_id": job_id}, {"$set": update})
+
+
+def _replay_spans(future):
+    if not future.cancelled() and future.exception() is None:
+        observe_spans(future.result())
+
+
+def _schedule(job_id: str, func, kwargs: dict):
+    future = get_executor().submit(_execute, job_id, func, kwargs)
+    _futures[job_id] = future
+    future.add_done_callback(lambda _: _futures.pop(job_id, None))
+    if TRAINING_EXECUTOR != "thread":
+        # Thread workers already recorded into this process's registry
+        future.add_done_callback(_replay_spans)
+    return future
+
+
+def submit_job(kind: str, func, kwargs: dict) -> str:
+    job_id = uuid.uuid4().hex
+    now = datetime.now()
+    jobs_collection.insert_one({
+        "_id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "progress": 0.0,
+        "stage": "queued",
+        "params": kwargs,
+        "func": f"{func.__module__}:{func.__name__}",
+        "owner": _owner(),
+        "created_at": now,
+        "updated_at": now,
+    })
+    _schedule(job_id, func, kwargs)
+    return job_id
+
+
+def get_job(job_id: str):
+    return jobs_collection.find_one({"_id": job_id})
+
+
+def list_jobs(status: str = None, limit: int = 50):
+    query = {"status": status} if status else {}
+    return list(jobs_collection.find(query).sort("created_at", -1).limit(limit))
+
+
+def cancel_job(job_id: str):
+    job = jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": {"$in": ACTIVE_STATUSES}},
+        {"$set": {"cancel_requested": True, "updated_at": datetime.now()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None:
+        return get_job(job_id)
+
+    # A queued job can be dropped outright; a running one stops at its next progress report
+    future = _futures.get(job_id)
+    if job["status"] == "queued" and (future is None or future.cancel()):
+        _finish(job_id, "cancelled")
+    return get_job(job_id)
+
+
+def _owner_alive(owner: str) -> bool:
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # Can't check processes on other hosts; assume their owner is still running
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _resolve(func_path: str):
+    module_name, _, func_name = func_path.partition(":")
+    module = __import__(module_name, fromlist=[func_name])
+    return getattr(module, func_name)
+
+
+def recover_jobs():
+    """Requeue jobs left queued or running by an API process that is no longer alive."""
+    recovered = []
+    for job in jobs_collection.find({"status": {"$in": ACTIVE_STATUSES}}):
+        if _owner_alive(job.get("owner")):
+            continue
+        if job.get("cancel_requested"):
+            _finish(job["_id"], "cancelled")
+            continue
+        claimed = jobs_collection.find_one_and_update(
+            {"_id": job["_id"], "owner": job.get("owner"), "status": {"$in": ACTIVE_STATUSES}},
+            {"$set": {"status": "queued", "stage": "requeued", "progress": 0.0,
+                      "owner": _owner(), "updated_at": datetime.now()}},
+        )
+        if claimed is None:
+            continue
+        _schedule(job["_id"], _resolve(job["func"]), job["params"])
+        recovered.append(job["_id"])
+    return recovered
+
+
+async def wait_for_job(job_id: str):
+    future = _futures.get(job_id)
+    if future is not None:
+        await asyncio.wrap_future(future)
+    return await asyncio.to_thread(get_job, job_id)
+
+
+def serialize_job(job: dict):
+    if job is None:
+        return None
+    fields = ["kind", "status", "stage", "progress", "params", "result", "error",
+              "cancel_requested", "created_at", "started_at", "finished_at", "timings"]
+    return {"job_id": job["_id"], **{field: job.get(field) for field in fields}}
+
+
+def shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
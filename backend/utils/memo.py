@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from bson import ObjectId
+
+from database.datasets import dataset_version
+from database.registry import datasets_registry, models_registry, training_runs
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def _source_version() -> str:
+    # Any edit to the preprocessing or model code changes this, so memoized results are never reused across it
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.sha256()
+    for package in ("preprocessing", "models"):
+        directory = os.path.join(root, package)
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".py"):
+                with open(os.path.join(directory, name), "rb") as f:
+                    digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:12]
+
+
+CODE_VERSION = os.getenv("MLSTUDIO_CODE_VERSION") or _source_version()
+
+
+def file_hash(file_obj) -> str:
+    """sha256 of a seekable upload, leaving it rewound for the reader after us."""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for block in iter(lambda: file_obj.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def config_hash(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def chain_hash(previous: str, appended: str) -> str:
+    # Content identity after an append: the old identity followed by the appended bytes
+    return hashlib.sha256(f"{previous}+{appended}".encode()).hexdigest()
+
+
+def dataset_hash(collection_name: str) -> str:
+    """Content identity of a dataset: the upload hash for raw data, the memo key for processed data."""
+    doc = datasets_registry.find_one({"_id": collection_name}, {"content_hash": 1})
+    if doc and doc.get("content_hash"):
+        return doc["content_hash"]
+    # Unfingerprinted (pre-registry) datasets fall back to name and write version
+    return f"{collection_name}@{dataset_version(collection_name)}"
+
+
+def memo_key(dataset: str, config: dict) -> str:
+    return config_hash({"dataset": dataset_hash(dataset), "config": config, "code_version": CODE_VERSION})
+
+
+def find_raw_dataset(content_hash: str):
+    return datasets_registry.find_one({"kind": "raw", "content_hash": content_hash, "status": {"$ne": "ingesting"}},
+                                      sort=[("created_at", 1)])
+
+
+def get_memoized_training(key: str):
+    run = training_runs.find_one({"_id": key})
+    if run is None:
+        return None
+    # The model may have been evicted since; then the run has to be redone
+    if not models_registry.find_one({"_id": ObjectId(run["file_id"])}, {"_id": 1}):
+        training_runs.delete_one({"_id": key})
+        return None
+    return run["result"]
+
+
+def save_memoized_training(key: str, dataset: str, config: dict, result: dict):
+    training_runs.replace_one({"_id": key}, {
+        "_id": key,
+        "dataset": dataset,
+        "config": config,
+        "code_version": CODE_VERSION,
+        "file_id": result["file_id"],
+        "result": result,
+        "created_at": datetime.now(),
+    }, upsert=True)
@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+from bson import ObjectId
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+
+from database.mongo import db
+from database.registry import datasets_registry
+from utils.artifacts import put_artifact, load_artifact
+
+PIPELINE_CACHE_SIZE = int(os.getenv("PIPELINE_CACHE_SIZE", "8"))
+
+PIPELINE_BUCKET = "pipelines"
+preprocessing_collection = db["preprocessing_pipelines"]
+pipeline_collection = db["model_pipelines"]
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _to_frame(X, columns):
+    # The estimator was fitted on named processed columns; restore the names
+    return pd.DataFrame(X, columns=columns)
+
+
+def save_preprocessing(processed_collection: str, pipeline: Pipeline, input_columns: list, target_column: str):
+    file_id, _ = put_artifact(pipeline, f"preprocessing_{processed_collection}", PIPELINE_BUCKET,
+                              {"processed_collection": processed_collection})
+    preprocessing_collection.replace_one(
+        {"_id": processed_collection},
+        {
+            "_id": processed_collection,
+            "file_id": file_id,
+            "input_columns": input_columns,
+            "target_column": target_column,
+            "created_at": datetime.now(),
+        },
+        upsert=True,
+    )
+    return str(file_id)
+
+
+def get_preprocessing(collection_name: str):
+    return preprocessing_collection.find_one({"_id": collection_name})
+
+
+def get_source_preprocessing(source_collection: str):
+    """Preprocessing record of the latest completed processed dataset derived from `source_collection`."""
+    processed = datasets_registry.find_one(
+        {"kind": "processed", "source": source_collection, "status": "complete"},
+        sort=[("updated_at", -1)],
+    )
+    return get_preprocessing(processed["_id"]) if processed else None
+
+
+def save_full_pipeline(model_file_id: str, preprocessing: dict):
+    """Compose the fitted preprocessing and a trained model into one artifact that scores raw rows."""
+    preprocess = load_artifact(preprocessing["file_id"], PIPELINE_BUCKET)
+    model = load_artifact(model_file_id)
+
+    steps = [("preprocess", preprocess)]
+    if hasattr(model, "feature_names_in_"):
+        steps.append(("names", FunctionTransformer(_to_frame, kw_args={"columns": list(model.feature_names_in_)})))
+    steps.append(("model", model))
+    pipeline = Pipeline(steps)
+
+    timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
+    file_id, _ = put_artifact(pipeline, f"pipeline_{timestamp}", PIPELINE_BUCKET, {"model_file_id": model_file_id})
+    pipeline_collection.insert_one({
+        "_id": file_id,
+        "model_file_id": model_file_id,
+        "processed_collection": preprocessing["_id"],
+        "input_columns": preprocessing["input_columns"],
+        "target_column": preprocessing["target_column"],
+        "created_at": datetime.now(),
+    })
+    return str(file_id)
+
+
+def load_pipeline(file_id: str):
+    """Return (pipeline, record) for a pipeline id or the id of the model it wraps, via an in-memory LRU."""
+    with _cache_lock:
+        if file_id in _cache:
+            _cache.move_to_end(file_id)
+            return _cache[file_id]
+
+    record = pipeline_collection.find_one({"model_file_id": file_id}, sort=[("created_at", -1)])
+    if record is None and ObjectId.is_valid(file_id):
+        record = pipeline_collection.find_one({"_id": ObjectId(file_id)})
+    if record is None:
+        return None
+
+    pipeline = load_artifact(record["_id"], PIPELINE_BUCKET)
+    with _cache_lock:
+        _cache[file_id] = (pipeline, record)
+        while len(_cache) > PIPELINE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pipeline, record
@@ -0,0 +1,210 @@
+import math
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from bson import Binary
+
+from database.mongo import db
+
+HLL_PRECISION = 12          # 4096 registers, ~1.6% standard error
+EXACT_DISTINCT_LIMIT = 64   # Below this many values the distinct count is exact
+
+profiles_collection = db["dataset_profiles"]
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    length = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        length[mask] += shift
+        x = np.where(mask, x >> np.uint64(shift), x)
+    return length + (x > 0)
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch over 64-bit hashes."""
+
+    def __init__(self, registers: np.ndarray = None, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = registers if registers is not None else np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        tail_bits = 64 - self.precision
+        index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+        tail = hashes & np.uint64((1 << tail_bits) - 1)
+        rank = (tail_bits - _bit_length(tail) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+def _hash_values(series: pd.Series) -> np.ndarray:
+    # Hash numbers as float64 so 1 and 1.0 from differently-typed chunks agree
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        series = series.astype("float64")
+    else:
+        series = series.astype(str)
+    return pd.util.hash_pandas_object(series, index=False).to_numpy(dtype=np.uint64)
+
+
+def _merge_dtype(current: str, new: str) -> str:
+    if current is None or current == new:
+        return new
+    numeric = ("int", "float", "uint")
+    if current.startswith(numeric) and new.startswith(numeric):
+        return "float64"
+    return "object"
+
+
+class ColumnProfile:
+    def __init__(self, name: str):
+        self.name = name
+        self.dtype = None
+        self.count = 0
+        self.null_count = 0
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = HyperLogLog()
+        self.exact = set()
+
+    def update(self, series: pd.Series):
+        self.dtype = _merge_dtype(self.dtype, str(series.dtype))
+        non_null = series.dropna()
+        self.count += len(series)
+        self.null_count += len(series) - len(non_null)
+
+        hashes = _hash_values(non_null)
+        self.sketch.add_hashes(hashes)
+        if self.exact is not None:
+            self.exact.update(hashes.astype(np.int64).tolist())
+            if len(self.exact) > EXACT_DISTINCT_LIMIT:
+                self.exact = None
+
+        if pd.api.types.is_numeric_dtype(non_null) and not pd.api.types.is_bool_dtype(non_null):
+            values = non_null.to_numpy(dtype="float64")
+            values = values[np.isfinite(values)]
+        else:
+            values = None
+
+        if values is not None and len(values):
+            # Chan et al. parallel update of mean and sum of squared deviations
+            n, chunk_mean = len(values), float(values.mean())
+            chunk_m2 = float(((values - chunk_mean) ** 2).sum())
+            total = self.numeric_count + n
+            delta = chunk_mean - self.mean
+            self.mean += delta * n / total
+            self.m2 += chunk_m2 + delta * delta * self.numeric_count * n / total
+            self.numeric_count = total
+            chunk_min, chunk_max = float(values.min()), float(values.max())
+            self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+            self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+    @property
+    def distinct(self) -> int:
+        return len(self.exact) if self.exact is not None else self.sketch.estimate()
+
+    def to_document(self) -> dict:
+        numeric = self.numeric_count > 0
+        return {
+            "name": self.name,
+            "dtype": self.dtype,
+            "count": self.count,
+            "null_count": self.null_count,
+            "distinct": self.distinct,
+            "distinct_exact": self.exact is not None,
+            "numeric_count": self.numeric_count,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean if numeric else None,
+            "m2": self.m2 if numeric else None,
+            "variance": self.m2 / (self.numeric_count - 1) if self.numeric_count > 1 else None,
+            "hll": Binary(self.sketch.registers.tobytes()),
+            "exact_hashes": sorted(self.exact) if self.exact is not None else None,
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "ColumnProfile":
+        column = cls(doc["name"])
+        column.dtype = doc["dtype"]
+        column.count = doc["count"]
+        column.null_count = doc["null_count"]
+        column.numeric_count = doc.get("numeric_count", 0)
+        column.mean = doc.get("mean") or 0.0
+        column.m2 = doc.get("m2") or 0.0
+        column.min = doc.get("min")
+        column.max = doc.get("max")
+        column.sketch = HyperLogLog(np.frombuffer(doc["hll"], dtype=np.uint8).copy())
+        column.exact = set(doc["exact_hashes"]) if doc.get("exact_hashes") is not None else None
+        return column
+
+
+class DatasetProfiler:
+    """Builds a dataset profile one chunk at a time; every statistic is mergeable."""
+
+    def __init__(self, columns: list = None):
+        self.columns = {column.name: column for column in columns or []}
+        self.row_count = 0
+
+    def update(self, df: pd.DataFrame):
+        self.row_count += len(df)
+        for name in df.columns:
+            key = str(name)
+            if key not in self.columns:
+                column = ColumnProfile(key)
+                # Column missing from earlier chunks: those rows were all null
+                column.count = column.null_count = self.row_count - len(df)
+                self.columns[key] = column
+            self.columns[key].update(df[name])
+        for key, column in self.columns.items():
+            if key not in df.columns.astype(str):
+                column.count += len(df)
+                column.null_count += len(df)
+        return self
+
+    def to_document(self) -> dict:
+        return {
+            "row_count": self.row_count,
+            "columns": [column.to_document() for column in self.columns.values()],
+        }
+
+    @classmethod
+    def from_document(cls, doc: dict) -> "DatasetProfiler":
+        profiler = cls([ColumnProfile.from_document(column) for column in doc["columns"]])
+        profiler.row_count = doc["row_count"]
+        return profiler
+
+
+def save_profile(collection_name: str, profiler: DatasetProfiler):
+    profiles_collection.replace_one(
+        {"_id": collection_name},
+        {"_id": collection_name, **profiler.to_document(), "updated_at": datetime.now()},
+        upsert=True,
+    )
+
+
+def profile_dataframe(collection_name: str, df: pd.DataFrame):
+    save_profile(collection_name, DatasetProfiler().update(df))
+
+
+def get_profile(collection_name: str):
+    return profiles_collection.find_one({"_id": collection_name}, {"columns.hll": 0, "columns.exact_hashes": 0})
+
+
+def get_profiler(collection_name: str):
+    doc = profiles_collection.find_one({"_id": collection_name})
+    return DatasetProfiler.from_document(doc) if doc else None
@@ -1,25 +1,28 @@
 # utils/save_model.py
-import pickle
-import io
-from gridfs import GridFS
 from datetime import datetime
-from database.mongo import db
-
-def save_model(model, model_name: str, metrics: dict):
-    fs = GridFS(db)
-    buffer = io.BytesIO()
-    pickle.dump(model, buffer)
-    buffer.seek(0)
+from database.registry import register_model
+from utils.artifacts import put_artifact, ARTIFACT_FORMAT
+from utils.instrumentation import span
+from utils.jobs import commit_job
 
+def save_model(model, model_name: str, metrics: dict, dataset: str = None, artifact_format: str = ARTIFACT_FORMAT):
     timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
-    file_id = fs.put(buffer, filename=f"{model_name}_{timestamp}")
+    filename = f"{model_name}_{timestamp}"
+    # The save is the job's commit point: cancel before it or not at all
+    commit_job("saving_model")
+    with span("save_model"):
+        file_id, artifact = put_artifact(model, filename, artifact_format=artifact_format)
 
-    model_collection = db[f"trained_model_{timestamp}"]
-    model_collection.insert_one({
-        "model_name": model_name,
-        "file_id": file_id,
-        "timestamp": timestamp,
-        **metrics
-    })
+        # One registry document per artifact, keyed by its GridFS id so same-second saves can't collide
+        register_model(
+            file_id,
+            model_type=model_name,
+            filename=filename,
+            metrics=metrics,
+            dataset=dataset,
+            timestamp=timestamp,
+            sha256=artifact["sha256"],
+            artifact=artifact,
+        )
 
-    return str(file_id), f"{model_name}_{timestamp}"
+    return str(file_id), filename
@@ -59,6 +59,7 @@ export default function FeatureSelectionComponent() {
 						.filter((f: string) => f !== "uploaded_filename")
 						.map((feature: string) => ({
 							name: feature,
+							type: data.dtypes?.[feature],
 						}));
 
 					setFeatureData(parsedFeatures);
@@ -214,6 +215,11 @@ export default function FeatureSelectionComponent() {
 														htmlFor={`manual-${feature.name}`}
 														className="font-medium">
 														{feature.name}
+														{feature.type && (
+															<span className="ml-2 text-xs text-muted-foreground">
+																{feature.type}
+															</span>
+														)}
 													</Label>
 												</div>
 											</div>
@@ -51,10 +51,6 @@ export default function TrainingPageComponent() {
 		setTrainingComplete(false);
 		setProgress(0);
 
-		const interval = setInterval(() => {
-			setProgress((prev) => (prev < 65 ? prev + 35 : prev));
-		}, 500);
-
 		try {
 			const response = await fetch("http://127.0.0.1:8000/train-model", {
 				method: "POST",
@@ -66,13 +62,34 @@ export default function TrainingPageComponent() {
 				}),
 			});
 
-			const data = await response.json();
+			const queued = await response.json();
 
 			if (!response.ok) {
-				alert(data.error || "Training failed");
+				alert(queued.detail || queued.error || "Training failed");
+				return;
+			}
+
+			// Training runs as a background job; poll it until it finishes
+			let job = queued;
+			while (job.status === "queued" || job.status === "running") {
+				await new Promise((resolve) => setTimeout(resolve, 1000));
+				const jobResponse = await fetch(
+					`http://127.0.0.1:8000/train-model/jobs/${queued.job_id}`
+				);
+				job = await jobResponse.json();
+				if (!jobResponse.ok) {
+					alert(job.detail || "Failed to fetch training status");
+					return;
+				}
+				setProgress(Math.round((job.progress ?? 0) * 100));
+			}
+
+			if (job.status !== "succeeded") {
+				alert(job.error || `Training ${job.status}`);
 				return;
 			}
 
+			const data = job.result;
 			setModelResults(data.metrics);
 			setTrainingComplete(true);
 			setDownloadUrl(
@@ -82,7 +99,6 @@ export default function TrainingPageComponent() {
 			console.error("Error during training:", err);
 			alert("An error occurred during training.");
 		} finally {
-			clearInterval(interval);
 			setProgress(100);
 			setIsTraining(false);
 		}